@@ -0,0 +1,479 @@
+# Scale benchmarks for the scheduling pipeline, run against an in-memory
+# stand-in for the Supabase client so no project is needed:
+#
+#     python benchmark.py --scale medium --output results.json
+#
+# Every stage records wall time, peak traced memory and the database
+# round-trips it made; the JSON output is meant to be diffed between commits.
+import os
+import csv
+import sys
+import json
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+import tracemalloc
+from datetime import datetime
+from time import perf_counter, sleep
+
+import numpy as np
+from fastapi import UploadFile
+
+# main.py builds its Supabase client at import time; the client is swapped
+# for MemorySupabase before anything talks to it
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "benchmark")
+
+import main
+
+
+# Every course becomes three sections (credits defaults to 3), so xl is about 5k sections
+SCALES = {
+    "small": {"courses": 50, "professors": 10, "classrooms": 8, "students": 500},
+    "medium": {"courses": 300, "professors": 60, "classrooms": 40, "students": 5000},
+    "large": {"courses": 1000, "professors": 200, "classrooms": 120, "students": 20000},
+    "xl": {"courses": 1667, "professors": 350, "classrooms": 200, "students": 50000},
+}
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+
+def synthetic_institution(
+    courses, professors, classrooms, students, courses_per_student=5, popularity_skew=1.0,
+    days=5, day_start=8, day_end=17, long_slots=(9, 13), groups=10, seed=0,
+):
+    # Deterministic for a given set of arguments. Slots are hourly, plus a few
+    # 90-minute slots per day (starting on the half hour at long_slots) so that
+    # mixed-length overlaps are exercised. Course popularity follows a Zipf-like
+    # curve: course k is picked with weight 1 / (k + 1) ** popularity_skew.
+    rng = random.Random(seed)
+
+    timetable_slots = []
+    for day in DAYS[:days]:
+        for hour in range(day_start, day_end):
+            timetable_slots.append({"day": day, "start_time": f"{hour:02d}:00:00", "end_time": f"{hour + 1:02d}:00:00"})
+        for hour in long_slots:
+            timetable_slots.append({"day": day, "start_time": f"{hour:02d}:30:00", "end_time": f"{hour + 2:02d}:00:00"})
+    for i, slot in enumerate(timetable_slots, 1):
+        slot["id"] = i
+
+    weights = list(itertools.accumulate(1 / (k + 1) ** popularity_skew for k in range(courses)))
+    enrollments = []
+    for student in range(1, students + 1):
+        picked = set()
+        while len(picked) < min(courses_per_student, courses):
+            picked.update(rng.choices(range(1, courses + 1), cum_weights=weights, k=courses_per_student - len(picked)))
+        enrollments.extend({"student_id": student, "course_id": course} for course in sorted(picked))
+
+    return {
+        "courses": [{"id": i, "name": f"Course {i}", "code": f"C{i:05d}"} for i in range(1, courses + 1)],
+        "professors": [
+            {"id": i, "name": f"Professor {i}", "email": f"prof{i}@example.edu"} for i in range(1, professors + 1)
+        ],
+        "students": [
+            {"id": i, "name": f"Student {i}", "email": f"student{i}@example.edu"} for i in range(1, students + 1)
+        ],
+        "classrooms": [
+            {"id": i, "name": f"Room {i}", "capacity": rng.choice((30, 40, 60, 120))} for i in range(1, classrooms + 1)
+        ],
+        "timetable_slots": timetable_slots,
+        "groups": [{"id": i, "name": f"Group {i}"} for i in range(1, groups + 1)],
+        "group_students": [{"group_id": 1 + (s - 1) % groups, "student_id": s} for s in range(1, students + 1)],
+        "enrollments": enrollments,
+    }
+
+
+# In-memory stand-in for the parts of the supabase-py client main.py uses.
+# Rows are kept per table; every execute() and storage upload counts as one
+# round-trip, and latency (seconds) can be added to each to model the network.
+
+class MemoryResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class MemoryQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.operation = "select"
+        self.payload = None
+        self.on_conflict = "id"
+        self.filters = []
+        self.ordering = None
+        self.window = None
+        self.single_row = False
+
+    def select(self, *columns, **options):
+        self.operation = "select"
+        return self
+
+    def insert(self, rows, **options):
+        self.operation, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="id", **options):
+        self.operation, self.payload, self.on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values, **options):
+        self.operation, self.payload = "update", values
+        return self
+
+    def delete(self, **options):
+        self.operation = "delete"
+        return self
+
+    def _filter(self, test):
+        self.filters.append(test)
+        return self
+
+    # PostgREST compares filter values as text
+    def eq(self, column, value):
+        return self._filter(lambda row: str(row.get(column)) == str(value))
+
+    def neq(self, column, value):
+        return self._filter(lambda row: str(row.get(column)) != str(value))
+
+    def gt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] > value)
+
+    def gte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] >= value)
+
+    def lt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] < value)
+
+    def lte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row[column] <= value)
+
+    def in_(self, column, values):
+        values = {str(v) for v in values}
+        return self._filter(lambda row: str(row.get(column)) in values)
+
+    def is_(self, column, value):
+        return self._filter(lambda row: row.get(column) is None)
+
+    def order(self, column, desc=False, **options):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, count, **options):
+        self.window = (0, count)
+        return self
+
+    def range(self, start, end, **options):
+        self.window = (start, end - start + 1)
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def execute(self):
+        self.db.round_trip(f"{self.table}.{self.operation}")
+        rows = self.db.tables.setdefault(self.table, [])
+
+        if self.operation in ("insert", "upsert"):
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            self.db.rows_written += len(payload)
+            keys = self.on_conflict.split(",")
+            if self.operation == "upsert":
+                by_key = self.db.keyed(self.table, keys)
+            else:
+                by_key = {}
+                self.db.keys.pop(self.table, None)
+            written = []
+            for row in payload:
+                row = dict(row)
+                key = tuple(row.get(k) for k in keys)
+                if self.operation == "upsert" and key in by_key:
+                    by_key[key].update(row)
+                    written.append(by_key[key])
+                    continue
+                row.setdefault("id", next(self.db.ids))
+                rows.append(row)
+                if self.operation == "upsert" and all(v is not None for v in key):
+                    by_key[key] = row
+                written.append(row)
+            return MemoryResponse([dict(row) for row in written])
+
+        matched = [row for row in rows if all(test(row) for test in self.filters)]
+        if self.operation == "update":
+            self.db.rows_written += len(matched)
+            for row in matched:
+                row.update(self.payload)
+            self.db.keys.pop(self.table, None)
+            return MemoryResponse([dict(row) for row in matched])
+        if self.operation == "delete":
+            self.db.rows_written += len(matched)
+            doomed = {id(row) for row in matched}
+            self.db.tables[self.table] = [row for row in rows if id(row) not in doomed]
+            self.db.keys.pop(self.table, None)
+            return MemoryResponse(matched)
+
+        if self.ordering is not None:
+            column, desc = self.ordering
+            matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self.window is not None:
+            start, count = self.window
+            matched = matched[start:start + count]
+        self.db.rows_read += len(matched)
+        data = [dict(row) for row in matched]
+        return MemoryResponse((data[0] if data else None) if self.single_row else data)
+
+
+class MemoryBucket:
+    def __init__(self, db, bucket):
+        self.db = db
+        self.bucket = bucket
+
+    def upload(self, path, file, file_options=None):
+        self.db.round_trip("storage.upload")
+        size = 0
+        if hasattr(file, "read"):
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                size += len(chunk)
+        else:
+            size = len(file)
+        self.db.files[(self.bucket, path)] = size
+        return {"path": path}
+
+
+class MemoryStorage:
+    def __init__(self, db):
+        self.db = db
+
+    def from_(self, bucket):
+        return MemoryBucket(self.db, bucket)
+
+
+class MemorySupabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.keys = {}
+        self.files = {}
+        self.ids = itertools.count(1)
+        self.calls = {}
+        self.rows_read = 0
+        self.rows_written = 0
+        self.storage = MemoryStorage(self)
+
+    def table(self, name):
+        return MemoryQuery(self, name)
+
+    def round_trip(self, operation):
+        # Background threads (storage uploads, chunked writes) report here too;
+        # dict updates are atomic enough under the GIL for counting
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            sleep(self.latency)
+
+    def keyed(self, table, keys):
+        # Upsert conflict index, built on first use per table and key
+        index = self.keys.setdefault(table, {})
+        if tuple(keys) not in index:
+            index[tuple(keys)] = {
+                tuple(row.get(k) for k in keys): row for row in self.tables.get(table, [])
+            }
+        return index[tuple(keys)]
+
+    def counters(self):
+        return {"calls": dict(self.calls), "rows_read": self.rows_read, "rows_written": self.rows_written}
+
+
+def measure(results, db, stage, fn, *args, **kwargs):
+    before = db.counters()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    started = perf_counter()
+    value = fn(*args, **kwargs)
+    seconds = perf_counter() - started
+    after = db.counters()
+
+    calls = {
+        op: count - before["calls"].get(op, 0)
+        for op, count in after["calls"].items()
+        if count != before["calls"].get(op, 0)
+    }
+    results.append({
+        "stage": stage,
+        "seconds": round(seconds, 4),
+        "peak_bytes": tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+        "db_calls": sum(calls.values()),
+        "db_calls_by_operation": calls,
+        "rows_read": after["rows_read"] - before["rows_read"],
+        "rows_written": after["rows_written"] - before["rows_written"],
+    })
+    return value
+
+
+def upload_tables(dataset, directory):
+    # Every CSV-importable table goes through the /upload-csv handler itself;
+    # group_students has no CSV schema and is seeded directly
+    for data_type, columns in main.CSV_SCHEMAS.items():
+        path = os.path.join(directory, f"{data_type}.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(columns), extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(dataset[data_type])
+        with open(path, "rb") as f:
+            asyncio.run(main.upload_csv(data_type, UploadFile(file=f, filename=f"{data_type}.csv")))
+    main.supabase.table("group_students").insert([dict(row) for row in dataset["group_students"]]).execute()
+
+
+def time_to_zero_hard_conflicts(data, initializer, population_size, max_generations, seed):
+    # Generations and seconds, initialization included, until the best schedule
+    # has no professor or classroom clash; both None if max_generations runs out first
+    started = perf_counter()
+    reached = {"generations": None, "seconds": None}
+    last = {}
+
+    def progress(generation, best_fitness, stats):
+        last.update(generations_run=generation, hard_conflicts=stats["hard_conflicts"], best_fitness=float(best_fitness))
+        if stats["hard_conflicts"] == 0:
+            reached.update(generations=generation, seconds=round(perf_counter() - started, 4))
+            return True
+        return False
+
+    main.run_genetic_algorithm(
+        data, population_size=population_size, generations=max_generations, initializer=initializer,
+        progress=progress, seed=seed,
+    )
+    return {"initializer": initializer, **reached, **last}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    params, generations=10, population_size=50, latency=0.0, seed=0, trace_memory=True, initializer="random",
+    convergence_generations=0,
+):
+    db = MemorySupabase(latency)
+    # Keep the metrics wrapper in place so its overhead is part of what gets measured
+    main.supabase = main.InstrumentedClient(db) if main.METRICS_ENABLED else db
+    main.invalidate_reference_cache()
+    results = []
+    convergence = []
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        dataset = measure(results, db, "synthetic_institution", synthetic_institution, seed=seed, **params)
+        with tempfile.TemporaryDirectory() as directory:
+            measure(results, db, "upload_csv", upload_tables, dataset, directory)
+        main.invalidate_reference_cache()
+        data = measure(results, db, "fetch_all_data", main.fetch_all_data)
+
+        model = main.encode_problem(data)
+        schedule = main.decode_genome(main.generate_random_genome(model, np.random.default_rng(seed)), model)
+        measure(results, db, "fitness", main.fitness, schedule, data)
+        schedule = measure(
+            results, db, "run_genetic_algorithm", main.run_genetic_algorithm,
+            data, population_size=population_size, generations=generations, initializer=initializer, seed=seed,
+        )
+        measure(results, db, "transform_schedule", main.transform_schedule, schedule, data)
+        measure(results, db, "persist_schedule", main.persist_schedule, schedule, "benchmark", "Benchmark", data)
+        if convergence_generations:
+            for name in ("random", "constructive"):
+                convergence.append(measure(
+                    results, db, f"zero_hard_conflicts[{name}]", time_to_zero_hard_conflicts,
+                    data, name, population_size, convergence_generations, seed,
+                ))
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    return {
+        "commit": git_commit(),
+        "recorded_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "metrics_enabled": main.METRICS_ENABLED,
+        "params": {
+            **params, "seed": seed, "generations": generations, "population_size": population_size,
+            "latency": latency, "trace_memory": trace_memory, "initializer": initializer,
+            "convergence_generations": convergence_generations,
+            "sections": sum(c.get("credits", 3) for c in data["courses"]),
+            "enrollments": len(data["enrollments"]),
+        },
+        "stages": results,
+        "zero_hard_conflicts": convergence,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the timetable pipeline against an in-memory database")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    for name in ("courses", "professors", "classrooms", "students", "courses-per-student"):
+        parser.add_argument(f"--{name}", type=int, help="override the scale preset")
+    parser.add_argument("--popularity-skew", type=float)
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--population-size", type=int, default=50)
+    parser.add_argument(
+        "--initializer", choices=("random", "constructive"), default="random",
+        help="initial population for the run_genetic_algorithm stage",
+    )
+    parser.add_argument(
+        "--convergence-generations", type=int, default=100,
+        help="generation cap when timing both initializers to zero hard conflicts; 0 skips the comparison",
+    )
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every database round-trip")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip tracemalloc, which slows allocation-heavy stages down"
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    params = dict(SCALES[args.scale])
+    for name in ("courses", "professors", "classrooms", "students", "courses_per_student", "popularity_skew"):
+        if getattr(args, name) is not None:
+            params[name] = getattr(args, name)
+
+    report = run_benchmark(
+        params, args.generations, args.population_size, args.latency_ms / 1000, args.seed, not args.no_memory,
+        args.initializer, args.convergence_generations,
+    )
+    report["scale"] = args.scale
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    # Human-readable summary on stderr so stdout stays valid JSON
+    for stage in report["stages"]:
+        peak = stage["peak_bytes"]
+        print(
+            f"{stage['stage']:<36}{stage['seconds']:>10.3f}s"
+            f"{'' if peak is None else f'{peak / 2**20:>10.1f} MiB'}{stage['db_calls']:>8} calls",
+            file=sys.stderr,
+        )
+    for run in report["zero_hard_conflicts"]:
+        reached = (
+            f"zero hard conflicts at generation {run['generations']} ({run['seconds']:.3f}s)"
+            if run["generations"] is not None
+            else f"{run['hard_conflicts']} hard conflicts left after {run['generations_run']} generations"
+        )
+        print(f"zero_hard_conflicts[{run['initializer']}]".ljust(36) + reached, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    cli()
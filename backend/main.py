@@ -1,15 +1,35 @@
 import os
 import csv
 import io
+import json
 import uuid
+import hashlib
+import asyncio
+import inspect
 from datetime import datetime, time, date
 from fastapi import FastAPI, UploadFile, File, HTTPException, status, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from supabase import create_client, Client
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from supabase import create_client, acreate_client, Client, AsyncClient, ClientOptions, AsyncClientOptions
+import httpx
+from postgrest.exceptions import APIError
+from contextlib import asynccontextmanager, contextmanager
 from dotenv import load_dotenv
 import random
+import multiprocessing
+import threading
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from functools import lru_cache
+from operator import itemgetter
+from itertools import chain, islice
+from time import monotonic, perf_counter, sleep, time as wall_clock
+from bisect import bisect_left
+import numpy as np
 from fastapi import Query
+from pydantic import BaseModel, Field
 
 load_dotenv()
 
@@ -19,11 +39,77 @@ SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
     raise RuntimeError("Missing Supabase environment variables")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# Both Supabase clients keep one pool of keep-alive connections for the whole
+# process. Background jobs and CSV imports run in threads on the blocking
+# client; request handlers await the async one (see get_db()).
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "120"))
+supabase_http_options = {
+    "limits": httpx.Limits(
+        max_connections=SUPABASE_MAX_CONNECTIONS,
+        max_keepalive_connections=SUPABASE_MAX_CONNECTIONS,
+        keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+    ),
+    "timeout": SUPABASE_TIMEOUT,
+    "http2": True,
+    "follow_redirects": True,
+}
+
+supabase: Client = create_client(
+    SUPABASE_URL, SUPABASE_SERVICE_KEY, options=ClientOptions(httpx_client=httpx.Client(**supabase_http_options))
+)
+async_supabase: AsyncClient = None
+async_supabase_lock = asyncio.Lock()
+
+
+async def get_db():
+    # Created on first use so its connections belong to the serving event loop
+    global async_supabase
+    if async_supabase is not None:
+        return async_supabase
+    async with async_supabase_lock:
+        if async_supabase is None:
+            client = await acreate_client(
+                SUPABASE_URL, SUPABASE_SERVICE_KEY,
+                options=AsyncClientOptions(httpx_client=httpx.AsyncClient(**supabase_http_options)),
+            )
+            async_supabase = InstrumentedClient(client) if METRICS_ENABLED else client
+    return async_supabase
+
+
+# Long .in_() filters overflow PostgREST's URL limit, so select_in() splits
+# the values into chunks and fetches them concurrently
+SELECT_IN_BATCH_SIZE = int(os.getenv("SELECT_IN_BATCH_SIZE", "200"))
+
+
+async def select_in(table, column, values, columns="*", **filters):
+    db = await get_db()
+    values = list(values)
+
+    async def select_chunk(chunk):
+        query = db.table(table).select(columns).in_(column, chunk)
+        for name, value in filters.items():
+            query = query.eq(name, value)
+        return (await query.execute()).data or []
+
+    chunks = [values[i:i + SELECT_IN_BATCH_SIZE] for i in range(0, len(values), SELECT_IN_BATCH_SIZE)]
+    return [row for rows in await asyncio.gather(*(select_chunk(chunk) for chunk in chunks)) for row in rows]
 
-app = FastAPI()
 
-jobs = {}
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    if async_supabase is not None:
+        await async_supabase.options.httpx_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Generation jobs run on a small thread pool so requests return immediately;
+# their state lives in job_store so every API worker process can see it
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "2"))
+job_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS)
 
 origins = [
     "http://localhost",
@@ -39,6 +125,235 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
+# Prometheus metrics, exposed on /metrics in the text exposition format.
+# METRICS_ENABLED=0 turns every recording call into a no-op, leaves the
+# Supabase client unwrapped and makes /metrics return 404.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+metrics = []
+
+
+def _metric_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+        metrics.append(self)
+
+    def inc(self, amount=1, *label_values):
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{_metric_labels(self.labels, key)} {value}" for key, value in self.series.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.series[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+        metrics.append(self)
+
+    def observe(self, value, *label_values):
+        if not METRICS_ENABLED:
+            return
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total) in self.series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_metric_labels(self.labels, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_metric_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_metric_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status")
+)
+db_request_seconds = Histogram(
+    "supabase_request_duration_seconds", "Supabase round-trips by table and operation", ("table", "operation", "outcome")
+)
+solver_iteration_seconds = Histogram(
+    "solver_iteration_duration_seconds",
+    "GA generation time, or time per 1000 annealing moves",
+    ("solver",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+fitness_evaluations = Counter(
+    "fitness_evaluations_total",
+    "Schedules scored from scratch (full), from parent counters (incremental) or moves priced (delta)",
+    ("kind",),
+)
+csv_rows_ingested = Counter("csv_ingest_rows_total", "CSV rows processed by /upload-csv", ("data_type",))
+csv_rows_per_second = Gauge(
+    "csv_ingest_rows_per_second", "Throughput of the most recent /upload-csv per data type", ("data_type",)
+)
+
+
+def timed_db_call(function, args, kwargs, labels):
+    # Works for both clients: coroutines from the async one are timed when awaited
+    started = perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    except Exception:
+        db_request_seconds.observe(perf_counter() - started, *labels, "error")
+        raise
+    if inspect.isawaitable(result):
+        return _timed_db_await(result, started, labels)
+    db_request_seconds.observe(perf_counter() - started, *labels, "ok")
+    return result
+
+
+async def _timed_db_await(awaitable, started, labels):
+    outcome = "error"
+    try:
+        result = await awaitable
+        outcome = "ok"
+        return result
+    finally:
+        db_request_seconds.observe(perf_counter() - started, *labels, outcome)
+
+
+class InstrumentedQuery:
+    # Wraps a supabase-py request builder; execute() is timed and labelled
+    # with the table and the last insert/select/upsert/update/delete called
+    OPERATIONS = {"select", "insert", "upsert", "update", "delete"}
+
+    def __init__(self, query, table):
+        self._query = query
+        self._table = table
+        self._operation = "select"
+
+    def __getattr__(self, name):
+        attribute = getattr(self._query, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            if name != "execute":
+                if name in self.OPERATIONS:
+                    self._operation = name
+                self._query = attribute(*args, **kwargs)
+                return self
+            return timed_db_call(attribute, args, kwargs, (self._table, self._operation))
+        return call
+
+
+class InstrumentedBucket:
+    def __init__(self, bucket, name):
+        self._bucket = bucket
+        self._name = name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._bucket, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return timed_db_call(attribute, args, kwargs, (f"storage:{self._name}", name))
+        return call
+
+
+class InstrumentedStorage:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def from_(self, bucket):
+        return InstrumentedBucket(self._storage.from_(bucket), bucket)
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+class InstrumentedClient:
+    def __init__(self, client):
+        self._client = client
+        self.storage = InstrumentedStorage(client.storage)
+
+    def table(self, name):
+        return InstrumentedQuery(self._client.table(name), name)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+if METRICS_ENABLED:
+    supabase = InstrumentedClient(supabase)
+
+    @app.middleware("http")
+    async def record_request_latency(request, call_next):
+        started = perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            # Route templates, not raw paths, so /job/{job_id} stays one series
+            route = request.scope.get("route")
+            http_request_seconds.observe(
+                perf_counter() - started, request.method, getattr(route, "path", "unmatched"), status_code
+            )
+
+
+def render_metrics():
+    with reference_cache_lock:
+        cache = {name: reference_cache[name] for name in ("hits", "misses", "evictions", "rows")}
+    lines = []
+    for metric in metrics:
+        lines += [f"# HELP {metric.name} {metric.documentation}", f"# TYPE {metric.name} {metric.kind}"]
+        lines += metric.samples()
+    for name in ("hits", "misses", "evictions"):
+        lines += [f"# TYPE reference_cache_{name}_total counter", f"reference_cache_{name}_total {cache[name]}"]
+    lines += ["# TYPE reference_cache_rows gauge", f"reference_cache_rows {cache['rows']}"]
+    return "\n".join(lines) + "\n"
+
+
 def convert_to_serializable(obj):
     if isinstance(obj, dict):
         return {k: convert_to_serializable(v) for k, v in obj.items()}
@@ -51,24 +366,87 @@ def convert_to_serializable(obj):
     else:
         return obj
 
+# /user-timetable only changes when a new version is generated (or a reference
+# upload renames something), so responses are cached as encoded JSON keyed by
+# version and lookup-table digest, and served with a matching ETag. Both parts
+# come from database contents, so every worker agrees on them. The latest
+# version id itself is rechecked at most every LATEST_VERSION_TTL seconds.
+LATEST_VERSION_TTL = float(os.getenv("LATEST_VERSION_TTL", "5"))
+USER_TIMETABLE_CACHE_SIZE = int(os.getenv("USER_TIMETABLE_CACHE_SIZE", "20000"))
+latest_version = {"id": None, "chain": None, "checked_at": None}
+user_timetable_cache = OrderedDict()
+user_timetable_cache_lock = threading.Lock()
+
+
+async def get_latest_version():
+    # (id, delta chain) of the newest completed version, or (None, None)
+    checked_at = latest_version["checked_at"]
+    if checked_at is not None and monotonic() - checked_at < LATEST_VERSION_TTL:
+        return latest_version["id"], latest_version["chain"]
+    versions_resp = await (await get_db()).table("timetable_versions")\
+        .select("*").eq("status", "completed").order("generated_at", desc=True).limit(1).execute()
+    if versions_resp.data:
+        version = versions_resp.data[0]
+        latest_version.update(id=version["id"], chain=version_chain(version), checked_at=monotonic())
+    else:
+        latest_version.update(id=None, chain=None, checked_at=monotonic())
+    return latest_version["id"], latest_version["chain"]
+
+
+def note_new_version(version_id, chain):
+    latest_version.update(id=version_id, chain=chain, checked_at=monotonic())
+    with user_timetable_cache_lock:
+        user_timetable_cache.clear()
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
 @app.get("/user-timetable")
-async def user_timetable(user_id: int, role: str):
+async def user_timetable(user_id: int, role: str, if_none_match: str = Header(None)):
     # 1. Get latest timetable version
-    versions_resp = supabase.table("timetable_versions")\
-        .select("*").order("generated_at", desc=True).limit(1).execute()
-    if not versions_resp.data:
+    latest_version_id, chain = await get_latest_version()
+    if latest_version_id is None:
         return {"error": "No timetable generated yet"}
-    latest_version_id = versions_resp.data[0]["id"]
 
-    # 2. Fetch timetable entries for this user
-    entries_resp = supabase.table("timetable_entries")\
+    ref_data = await fetch_all_data_async(LOOKUP_TABLES)
+    lookups = lookup_digest(ref_data)
+    etag = f'"v{latest_version_id}-r{lookups}-{role}-{user_id}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (user_id, role, latest_version_id, lookups)
+    with user_timetable_cache_lock:
+        body = user_timetable_cache.get(key)
+        if body is not None:
+            user_timetable_cache.move_to_end(key)
+    if body is None:
+        body = json.dumps(await build_user_timetable(user_id, role, chain, ref_data)).encode()
+        with user_timetable_cache_lock:
+            user_timetable_cache[key] = body
+            while len(user_timetable_cache) > USER_TIMETABLE_CACHE_SIZE:
+                user_timetable_cache.popitem(last=False)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def build_user_timetable(user_id, role, chain, ref_data):
+    # 2. Fetch timetable entries for this user: delta versions only write the
+    # users whose timetable changed, so take the newest entry along the chain
+    entries_resp = await (await get_db()).table("timetable_entries")\
         .select("*")\
         .eq("user_id", user_id)\
         .eq("role", role)\
-        .eq("timetable_version_id", latest_version_id)\
+        .in_("timetable_version_id", chain)\
+        .order("timetable_version_id", desc=True)\
         .limit(1).execute()
 
-    if not entries_resp.data:
+    entry = entries_resp.data[0] if entries_resp.data else None
+    if entry is None or not (entry.get("course_ids") or entry.get("timetable")):
         return {
             "user_id": user_id,
             "role": role,
@@ -76,20 +454,29 @@ async def user_timetable(user_id: int, role: str):
             "message": "No timetable entries found for this user"
         }
 
-    timetable = entries_resp.data[0]["timetable"]
-
-    # 3. Fetch reference data to enrich timetable
-    ref_data = fetch_all_data()
-    courses_info = {c['id']: c for c in ref_data['courses']}
-    classrooms_info = {c['id']: c['name'] for c in ref_data['classrooms']}
-    professors_info = {p['id']: p['name'] for p in ref_data['professors']}
-
-    # 4. Enrich with names
-    for row in timetable:
-        row["course_name"] = courses_info.get(row["course_id"], {}).get("name", "")
-        row["course_code"] = courses_info.get(row["course_id"], {}).get("code", "")
-        row["classroom_name"] = classrooms_info.get(row["classroom_id"], "")
-        row["professor_name"] = professors_info.get(row["professor_id"], "")
+    # 3. Hydrate the entry's course ids from the version's rows; entries
+    # written before versions kept a course index hold full row copies
+    version_id = chain[-1]
+    if entry.get("course_ids") is None:
+        rows = entry["timetable"]
+    else:
+        by_course = await version_course_rows(version_id)
+        rows = [row for course in entry["course_ids"] for row in by_course.get(course, ())]
+        if role == "professor":
+            rows = [row for row in rows if str(row["professor_id"]) == str(user_id)]
+
+    # 4. Enrich with names, on copies since rows are shared by the version cache
+    courses_info = ref_data['courses_by_id']
+    classrooms_info = ref_data['classrooms_by_id']
+    professors_info = ref_data['professors_by_id']
+    timetable = [{
+        "timetable_version_id": version_id,
+        **row,
+        "course_name": courses_info.get(row["course_id"], {}).get("name", ""),
+        "course_code": courses_info.get(row["course_id"], {}).get("code", ""),
+        "classroom_name": classrooms_info.get(row["classroom_id"], {}).get("name", ""),
+        "professor_name": professors_info.get(row["professor_id"], {}).get("name", ""),
+    } for row in rows]
 
     # 5. Group by day + sort by start_time
     day_order = {"Monday": 1, "Tuesday": 2, "Wednesday": 3,
@@ -107,7 +494,7 @@ async def user_timetable(user_id: int, role: str):
     return {
         "user_id": user_id,
         "role": role,
-        "timetable_version_id": latest_version_id,
+        "timetable_version_id": chain[-1],
         "timetable": sorted_days
     }
 
@@ -115,436 +502,2446 @@ async def user_timetable(user_id: int, role: str):
 
 
 
+# Columns each upload type must provide, with the converter applied to each value
+CSV_SCHEMAS = {
+    "courses": {"id": int, "name": str, "code": str},
+    "professors": {"id": int, "name": str, "email": str},
+    "students": {"id": int, "name": str, "email": str},
+    "enrollments": {"student_id": int, "course_id": int},
+    "classrooms": {"id": int, "name": str, "capacity": int},
+    "timetable_slots": {"id": int, "day": str, "start_time": str, "end_time": str},
+    "groups": {"id": int, "name": str},
+}
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+
+class PositionalReader(io.RawIOBase):
+    # Reads an open file descriptor through its own offset, so the Storage
+    # upload and the CSV parser can walk the same spooled upload concurrently
+    def __init__(self, fd):
+        self.fd = fd
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.offset
+        elif whence == io.SEEK_END:
+            offset += os.fstat(self.fd).st_size
+        self.offset = offset
+        return self.offset
+
+    def readinto(self, buffer):
+        data = os.pread(self.fd, len(buffer), self.offset)
+        buffer[:len(data)] = data
+        self.offset += len(data)
+        return len(data)
+
+
+def iter_batches(rows, size):
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def upsert_batch(table_name, batch):
+    result = supabase.table(table_name).upsert(batch, on_conflict='id').execute()
+    return len(result.data) if result.data else len(batch)
+
+
+def ingest_csv(data_type, file, file_path):
+    columns = CSV_SCHEMAS[data_type]
+    table_name = data_type
+    # fileno() moves a small in-memory upload to disk; the body is never held in memory twice
+    fd = file.file.fileno()
+
+    started = perf_counter()
+    background = ThreadPoolExecutor(max_workers=2)
+    storage_future = background.submit(
+        supabase.storage.from_("uploads").upload, file_path, io.BufferedReader(PositionalReader(fd))
+    )
+
+    try:
+        reader = csv.DictReader(io.TextIOWrapper(io.BufferedReader(PositionalReader(fd)), encoding="utf-8", newline=""))
+        batches = iter_batches(reader, IMPORT_BATCH_SIZE)
+        try:
+            first_batch = next(batches, None)
+        except UnicodeDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"File encoding error: {str(e)}")
+        if not first_batch:
+            raise HTTPException(status_code=400, detail="CSV file is empty")
+        if not set(columns).issubset(reader.fieldnames):
+            raise HTTPException(
+                status_code=400, detail=f"CSV for {data_type} must contain columns: {set(columns)}"
+            )
+
+        audit_id = supabase.table("import_audit").insert({
+            "filename": file.filename,
+            "status": "processing",
+            "message": f"Importing into {table_name}",
+            "records_processed": 0,
+            "records_inserted": 0
+        }).execute().data[0]["id"]
+
+        processed = 0
+        inserted = 0
+        errors = []
+        conversion_failed = False
+
+        def collect(pending):
+            # Wait for the previous batch's upsert and record its outcome
+            nonlocal inserted
+            number, future = pending
+            try:
+                inserted += future.result()
+            except Exception as e:
+                errors.append(f"Batch {number}: Database operation failed: {str(e)}")
+            supabase.table("import_audit").update({
+                "records_processed": processed,
+                "records_inserted": inserted,
+                "errors": errors,
+            }).eq("id", audit_id).execute()
+
+        # Convert batch N while batch N-1 is being upserted; at most two batches are alive
+        pending = None
+        number = 0
+        try:
+            for number, rows in enumerate(chain([first_batch], batches), 1):
+                try:
+                    batch = [{col: convert(row[col]) for col, convert in columns.items()} for row in rows]
+                except (ValueError, TypeError, KeyError) as e:
+                    conversion_failed = True
+                    errors.append(f"Batch {number}: Data conversion error: {str(e)}")
+                    batch = None
+                processed += len(rows)
+                if pending is not None:
+                    collect(pending)
+                    pending = None
+                if batch:
+                    pending = (number, background.submit(upsert_batch, table_name, batch))
+        except UnicodeDecodeError as e:
+            conversion_failed = True
+            errors.append(f"Batch {number + 1}: File encoding error: {str(e)}")
+        if pending is not None:
+            collect(pending)
+
+        if inserted:
+            invalidate_reference_cache()
+        csv_rows_ingested.inc(processed, data_type)
+        csv_rows_per_second.set(round(processed / max(perf_counter() - started, 1e-9), 1), data_type)
+
+        try:
+            storage_future.result()
+        except Exception as e:
+            errors.append(f"Storage upload failed: {str(e)}")
+
+        status_label = "success" if not errors else ("partial" if inserted else "failed")
+        supabase.table("import_audit").update({
+            "status": status_label,
+            "message": f"Upserted {inserted} records into {table_name}" if not errors else errors[0],
+            "records_processed": processed,
+            "records_inserted": inserted,
+            "errors": errors,
+        }).eq("id", audit_id).execute()
+    finally:
+        background.shutdown(wait=True)
+
+    # A failed Storage upload is reported like a failed batch: once rows are
+    # committed the import is partial, and a 500 would invite a duplicate retry
+    if status_label == "failed":
+        raise HTTPException(status_code=400 if conversion_failed else 500, detail="; ".join(errors))
+
+    response = {
+        "message": f"Uploaded and upserted {inserted} rows into {table_name}",
+        "storage_path": file_path if storage_future.exception() is None else None,
+        "records_processed": processed,
+        "records_inserted": inserted
+    }
+    if errors:
+        response["status"] = status_label
+        response["errors"] = errors
+    return response
+
+
 @app.post("/upload-csv")
 async def upload_csv(data_type: str, file: UploadFile = File(...)):
-    allowed_types = {"courses", "professors", "students", "enrollments", "classrooms", "timetable_slots", "groups"}
-    if data_type not in allowed_types:
+    if data_type not in CSV_SCHEMAS:
         raise HTTPException(status_code=400, detail="Invalid data_type")
 
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only CSV files allowed")
 
-    content = await file.read()
     file_path = f"uploads/{datetime.utcnow().strftime('%Y%m%d_%H%M%S_')}{file.filename}"
 
-    try:
-        supabase.storage.from_("uploads").upload(file_path, content)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Storage upload failed: {str(e)}",
-        )
+    # Parsing, upserts and the Storage upload all block, so keep them off the event loop
+    return JSONResponse(await run_in_threadpool(ingest_csv, data_type, file, file_path))
 
-    try:
-        file_stream = io.StringIO(content.decode("utf-8"))
-        csv_reader = csv.DictReader(file_stream)
-        rows = list(csv_reader)
 
-        if not rows:
-            raise HTTPException(status_code=400, detail="CSV file is empty")
+REFERENCE_TABLES = (
+    "courses", "professors", "classrooms", "timetable_slots", "groups", "group_students", "enrollments",
+)
+# Enough to resolve names when rendering a timetable
+LOOKUP_TABLES = ("courses", "classrooms", "professors")
+
+# Reference tables are cached per process. Entries expire after the TTL or as
+# soon as /upload-csv bumps the generation, which lives in the job store so
+# every worker sees an upload any of them handled; least recently used tables are
+# dropped once more than REFERENCE_CACHE_MAX_ROWS rows are held. Cached lists
+# are shared between callers and must be treated as read-only.
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_MAX_ROWS = int(os.getenv("REFERENCE_CACHE_MAX_ROWS", "500000"))
+reference_cache = {"entries": OrderedDict(), "rows": 0, "hits": 0, "misses": 0, "evictions": 0}
+reference_cache_lock = threading.Lock()
+
+
+# Rows are put in key order whatever order the database returned them in, so
+# equal tables always give the solvers identical input. Each table's digest
+# feeds input_fingerprint().
+REFERENCE_ROW_KEYS = {"enrollments": ("student_id", "course_id"), "group_students": ("group_id", "student_id")}
+
+
+def reference_part(name, rows):
+    rows = sorted(rows, key=itemgetter(*REFERENCE_ROW_KEYS.get(name, ("id",))))
+    part = {
+        name: rows,
+        f"{name}_digest": hashlib.sha256(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest(),
+    }
+    if name == "enrollments":
+        part["enrollment_index"] = build_enrollment_index(rows)
+    elif name == "timetable_slots":
+        part["slot_table"] = build_slot_table(rows)
+    if name in LOOKUP_TABLES:
+        part[f"{name}_by_id"] = {row["id"]: row for row in rows}
+    return part
+
+
+def lookup_digest(data):
+    # Identifies the names a rendered timetable was built with, the same in every worker
+    return hashlib.sha256("".join(data[f"{name}_digest"] for name in LOOKUP_TABLES).encode()).hexdigest()[:16]
+
+
+def load_reference_table(name):
+    return reference_part(name, supabase.table(name).select("*").execute().data)
+
+
+async def load_reference_table_async(name):
+    rows = (await (await get_db()).table(name).select("*").execute()).data
+    # Sorting, hashing and index building are CPU work; keep them off the event loop
+    return await run_in_threadpool(reference_part, name, rows)
+
+
+def reference_generation():
+    return job_store.counter("reference_generation")
+
+
+def lookup_reference_table(name, generation):
+    # The cached part if it was loaded under the current generation, else None
+    with reference_cache_lock:
+        entry = reference_cache["entries"].get(name)
+        if (
+            entry is not None
+            and entry["generation"] == generation
+            and monotonic() - entry["loaded_at"] < REFERENCE_CACHE_TTL
+        ):
+            reference_cache["entries"].move_to_end(name)
+            reference_cache["hits"] += 1
+            return entry["part"]
+        reference_cache["misses"] += 1
+        return None
+
+
+def store_reference_table(name, part, generation):
+    rows = len(part[name])
+    # Skip storing if an upload in any worker invalidated the cache while we were loading
+    if generation != reference_generation() or rows > REFERENCE_CACHE_MAX_ROWS:
+        return part
+    with reference_cache_lock:
+        old = reference_cache["entries"].pop(name, None)
+        if old is not None:
+            reference_cache["rows"] -= old["rows"]
+        reference_cache["entries"][name] = {"part": part, "rows": rows, "generation": generation, "loaded_at": monotonic()}
+        reference_cache["rows"] += rows
+        while reference_cache["rows"] > REFERENCE_CACHE_MAX_ROWS:
+            _, evicted = reference_cache["entries"].popitem(last=False)
+            reference_cache["rows"] -= evicted["rows"]
+            reference_cache["evictions"] += 1
+    return part
+
+
+def invalidate_reference_cache():
+    job_store.bump("reference_generation")
+    with reference_cache_lock:
+        reference_cache["entries"].clear()
+        reference_cache["rows"] = 0
+
+
+def fetch_all_data(tables=REFERENCE_TABLES, fresh=False):
+    # Tables missing from the cache are loaded concurrently over the pooled client.
+    # fresh loads every table (and refreshes the cache with it); solver runs and
+    # the fingerprint checks in front of them use it, so they never see rows
+    # older than the database's, whatever the TTL.
+    generation = reference_generation()
+    data = {}
+    missing = []
+    for name in tables:
+        part = None if fresh else lookup_reference_table(name, generation)
+        if part is None:
+            missing.append(name)
+        else:
+            data.update(part)
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            for name, part in zip(missing, pool.map(load_reference_table, missing)):
+                data.update(store_reference_table(name, part, generation))
+    return data
+
+
+async def fetch_all_data_async(tables=REFERENCE_TABLES, fresh=False):
+    # fetch_all_data() for request handlers: misses are gathered on the event loop
+    generation = reference_generation()
+    data = {}
+    missing = []
+    for name in tables:
+        part = None if fresh else lookup_reference_table(name, generation)
+        if part is None:
+            missing.append(name)
+        else:
+            data.update(part)
+    parts = await asyncio.gather(*(load_reference_table_async(name) for name in missing))
+    for name, part in zip(missing, parts):
+        data.update(store_reference_table(name, part, generation))
+    return data
 
-        table_name = ""
-        batch_data = []
-
-        if data_type == "courses":
-            required_cols = {"id", "name", "code"}
-            if not required_cols.issubset(rows[0].keys()):
-                raise HTTPException(status_code=400, detail=f"CSV for courses must contain columns: {required_cols}")
-            table_name = "courses"
-            batch_data = [{"id": int(row['id']), "name": row['name'], "code": row['code']} for row in rows]
-
-        elif data_type == "professors":
-            required_cols = {"id", "name", "email"}
-            if not required_cols.issubset(rows[0].keys()):
-                raise HTTPException(status_code=400, detail=f"CSV for professors must contain columns: {required_cols}")
-            table_name = "professors"
-            batch_data = [{"id": int(row['id']), "name": row['name'], "email": row['email']} for row in rows]
-
-        elif data_type == "students":
-            required_cols = {"id", "name", "email"}
-            if not required_cols.issubset(rows[0].keys()):
-                raise HTTPException(status_code=400, detail=f"CSV for students must contain columns: {required_cols}")
-            table_name = "students"
-            batch_data = [{"id": int(row['id']), "name": row['name'], "email": row['email']} for row in rows]
-
-        elif data_type == "enrollments":
-            required_cols = {"student_id", "course_id"}
-            if not required_cols.issubset(rows[0].keys()):
-                raise HTTPException(status_code=400, detail=f"CSV for enrollments must contain columns: {required_cols}")
-            table_name = "enrollments"
-            batch_data = [{"student_id": int(row['student_id']), "course_id": int(row['course_id'])} for row in rows]
-
-        elif data_type == "classrooms":
-            required_cols = {"id", "name", "capacity"}
-            if not required_cols.issubset(rows[0].keys()):
-                raise HTTPException(status_code=400, detail=f"CSV for classrooms must contain columns: {required_cols}")
-            table_name = "classrooms"
-            batch_data = [{"id": int(row['id']), "name": row['name'], "capacity": int(row['capacity'])} for row in rows]
-
-        elif data_type == "timetable_slots":
-            required_cols = {"id", "day", "start_time", "end_time"}
-            if not required_cols.issubset(rows[0].keys()):
-                raise HTTPException(status_code=400, detail=f"CSV for timetable_slots must contain columns: {required_cols}")
-            table_name = "timetable_slots"
-            batch_data = [{"id": int(row['id']), "day": row['day'], "start_time": row['start_time'], "end_time": row['end_time']} for row in rows]
-
-        elif data_type == "groups":
-            required_cols = {"id", "name"}
-            if not required_cols.issubset(rows[0].keys()):
-                raise HTTPException(status_code=400, detail=f"CSV for groups must contain columns: {required_cols}")
-            table_name = "groups"
-            batch_data = [{"id": int(row['id']), "name": row['name']} for row in rows]
 
-        else:
-            raise HTTPException(status_code=400, detail=f"Data type {data_type} not implemented yet")
-
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"Data conversion error: {str(e)}")
-    except KeyError as e:
-        raise HTTPException(status_code=400, detail=f"Missing column in CSV: {str(e)}")
-    except UnicodeDecodeError as e:
-        raise HTTPException(status_code=400, detail=f"File encoding error: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+def build_enrollment_index(enrollments):
+    # Built once per data snapshot so fitness() never rescans raw enrollments
+    student_courses = {}
+    for e in enrollments:
+        student_courses.setdefault(e['student_id'], set()).add(e['course_id'])
+
+    course_index = {}
+    pair_students = {}
+    for courses in student_courses.values():
+        ids = sorted(course_index.setdefault(c, len(course_index)) for c in courses)
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                pair_students[(a, b)] = pair_students.get((a, b), 0) + 1
+    student_counts = np.bincount(
+        [course_index[c] for courses in student_courses.values() for c in courses], minlength=len(course_index)
+    )
+
+    pairs = np.array(list(pair_students.keys()), dtype=np.int64).reshape(-1, 2)
+    return {
+        "course_index": course_index,
+        "student_counts": student_counts,
+        "student_courses": {s: tuple(sorted(c)) for s, c in student_courses.items()},
+        "pair_a": pairs[:, 0],
+        "pair_b": pairs[:, 1],
+        "pair_students": np.fromiter(pair_students.values(), dtype=np.int64, count=len(pair_students)),
+    }
 
-    try:
-        result = supabase.table(table_name).upsert(batch_data, on_conflict='id').execute()
-        inserted_count = len(result.data) if result.data else len(batch_data)
 
-        supabase.table("import_audit").insert({
-            "filename": file.filename,
-            "status": "success",
-            "message": f"Upserted {inserted_count} records into {table_name}",
-            "records_processed": len(batch_data),
-            "records_inserted": inserted_count
-        }).execute()
+PROFESSOR_CLASH_PENALTY = 50
+CLASSROOM_CLASH_PENALTY = 50
+SAME_DAY_REPEAT_PENALTY = 30
+STUDENT_CLASH_PENALTY = 10
+PROFESSOR_DAY_OVERLOAD_PENALTY = 20
+PROFESSOR_WEEK_IMBALANCE_PENALTY = 5
+MAX_PROFESSOR_DAY_HOURS = 5
+TARGET_PROFESSOR_WEEK_HOURS = 20
 
-    except Exception as e:
-        error_message = str(e)
-        supabase.table("import_audit").insert({
-            "filename": file.filename,
-            "status": "failed",
-            "message": error_message,
-            "records_processed": len(batch_data),
-            "records_inserted": 0
-        }).execute()
-        raise HTTPException(status_code=500, detail=f"Database operation failed: {error_message}")
 
-    return JSONResponse({
-        "message": f"Uploaded and upserted {len(batch_data)} rows into {table_name}",
-        "storage_path": file_path,
-        "records_processed": len(batch_data),
-        "records_inserted": inserted_count
-    })
+@lru_cache(maxsize=None)
+def time_to_minutes(value):
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
 
 
-def fetch_all_data():
-    courses = supabase.table("courses").select("*").execute().data
-    professors = supabase.table("professors").select("*").execute().data
-    classrooms = supabase.table("classrooms").select("*").execute().data
-    timetable_slots = supabase.table("timetable_slots").select("*").execute().data
-    groups = supabase.table("groups").select("*").execute().data
-    group_students = supabase.table("group_students").select("*").execute().data
-    enrollments = supabase.table("enrollments").select("*").execute().data
+def bucket_ids(keys):
+    # Map arbitrary hashable keys to dense ints so buckets can be sorted together
+    ids = {}
+    return np.fromiter((ids.setdefault(k, len(ids)) for k in keys), dtype=np.int64, count=len(keys))
 
-    return {
-        "courses": courses,
-        "professors": professors,
-        "classrooms": classrooms,
-        "timetable_slots": timetable_slots,
-        "groups": groups,
-        "group_students": group_students,
-        "enrollments": enrollments,
-    }
 
+def build_slot_table(slots):
+    # Integer slot ids plus a precomputed overlap matrix, so any conflict test
+    # between two placements is a single lookup; slots may differ in length
+    day_ids = {}
+    day = np.array([day_ids.setdefault(s['day'], len(day_ids)) for s in slots], dtype=np.int64)
+    start = np.array([time_to_minutes(s['start_time']) for s in slots], dtype=np.int64)
+    end = np.array([time_to_minutes(s['end_time']) for s in slots], dtype=np.int64)
+    overlap = (day[:, None] == day[None, :]) & (np.maximum(start[:, None], start[None, :]) < np.minimum(end[:, None], end[None, :]))
 
-def time_slots_conflict(slot1, slot2):
-    if slot1['day'] != slot2['day']:
-        return False
-    return max(slot1['start_time'], slot2['start_time']) < min(slot1['end_time'], slot2['end_time'])
+    # Extra all-False row/column stands in for "no slot" when padding ragged arrays
+    padded = np.zeros((len(slots) + 1, len(slots) + 1), dtype=bool)
+    padded[:-1, :-1] = overlap
 
+    index = {}
+    for i, s in enumerate(slots):
+        index.setdefault((s['day'], s['start_time'], s['end_time']), i)
+    return {
+        "slots": slots,
+        "index": index,
+        "day": day,
+        "n_days": max(len(day_ids), 1),
+        "start": start,
+        "end": end,
+        "overlap": overlap,
+        "overlap_counts": overlap.astype(np.int64),
+        "overlap_weights": overlap.astype(np.float64),
+        "overlap_padded": padded,
+    }
 
-def fitness(schedule, data):
+
+def count_slot_clashes(owners, slots, slot_table):
+    # Pairs of entries with the same owner (professor, classroom) in overlapping slots
+    n_slots = len(slot_table['slots'])
+    counts = np.bincount(owners * n_slots + slots, minlength=(int(owners.max()) + 1) * n_slots)
+    counts = counts.reshape(-1, n_slots).astype(np.float64)
+    weights = slot_table['overlap_weights']
+    ordered_pairs = ((counts @ weights) * counts).sum() - (counts * weights.diagonal()).sum()
+    return int(round(ordered_pairs)) // 2
+
+
+def course_layout(course_idx):
+    # Position of every enrolled entry in a (course, n-th entry of that course) grid
+    entries = np.flatnonzero(course_idx >= 0)
+    courses = course_idx[entries]
+    order = np.argsort(courses, kind='stable')
+    sorted_courses = courses[order]
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order)) - np.searchsorted(sorted_courses, sorted_courses, side='left')
+    return {"entries": entries, "courses": courses, "rank": rank, "width": int(rank.max()) + 1 if len(rank) else 0}
+
+
+def student_penalty(index, slot_table, layout, slots):
+    penalty = 0
+    if not len(layout['entries']):
+        return 0
+    courses = layout['courses']
+    slots = slots[layout['entries']]
+    days = slot_table['day'][slots]
+
+    # Same subject twice a day: every enrolled student pays for each repeat
+    n_days = slot_table['n_days']
+    keys, occurrences = np.unique(courses * n_days + days, return_counts=True)
+    students = index['student_counts'][keys // n_days]
+    penalty += SAME_DAY_REPEAT_PENALTY * int((students * occurrences * (occurrences - 1)).sum())
+
+    # Time clash between two different courses that share students
+    if len(index['pair_students']):
+        course_slots = np.full((len(index['student_counts']), layout['width']), len(slot_table['slots']), dtype=np.int64)
+        course_slots[courses, layout['rank']] = slots
+        a = course_slots[index['pair_a']]
+        b = course_slots[index['pair_b']]
+        clashes = slot_table['overlap_padded'][a[:, :, None], b[:, None, :]].sum(axis=(1, 2))
+        penalty += STUDENT_CLASH_PENALTY * int((clashes * index['pair_students']).sum())
+
+    return penalty
+
+
+def score_entries(index, slot_table, layout, professors, classrooms, slots):
+    # professors, classrooms and slots are parallel int arrays, one item per schedule entry
     conflicts = 0
+    if not len(slots):
+        return conflicts
 
     # Conflict: professors or classrooms overlap
-    for i in range(len(schedule)):
-        for j in range(i + 1, len(schedule)):
-            a, b = schedule[i], schedule[j]
-            if a['professor_id'] == b['professor_id'] and time_slots_conflict(a, b):
-                conflicts += 50
-            if a['classroom_id'] == b['classroom_id'] and time_slots_conflict(a, b):
-                conflicts += 50
-
-    # Build student course mapping
-    enrollments = data['enrollments']
-    student_courses = {}
-    for e in enrollments:
-        student_courses.setdefault(e['student_id'], []).append(e['course_id'])
+    conflicts += PROFESSOR_CLASH_PENALTY * count_slot_clashes(professors, slots, slot_table)
+    conflicts += CLASSROOM_CLASH_PENALTY * count_slot_clashes(classrooms, slots, slot_table)
 
-    # Student constraint: no same subject twice a day
-    for entry in schedule:
-        course = entry['course_id']
-        day = entry['day']
-        for student_id, courses in student_courses.items():
-            if course in courses:
-                key = (student_id, course, day)
-                # Count how many times this student has the same course on same day
-                occurrences = sum(
-                    1 for e in schedule if e['course_id'] == course and e['day'] == day
-                )
-                if occurrences > 1:
-                    conflicts += 30 * (occurrences - 1)
+    # Student constraints come from the enrollment index, never from raw rows
+    if len(index['course_index']):
+        conflicts += student_penalty(index, slot_table, layout, slots)
 
     # Professor load distribution
-    prof_day_hours = {}
-    prof_week_hours = {}
+    prof_days = professors * slot_table['n_days'] + slot_table['day'][slots]
+    day_hours = np.unique(prof_days, return_counts=True)[1]
+    week_hours = np.unique(professors, return_counts=True)[1]
+    overload = np.clip(day_hours - MAX_PROFESSOR_DAY_HOURS, 0, None)  # more than 5 hours in a single day
+    conflicts += int(overload.sum()) * PROFESSOR_DAY_OVERLOAD_PENALTY
+    conflicts += int(np.abs(TARGET_PROFESSOR_WEEK_HOURS - week_hours).sum()) * PROFESSOR_WEEK_IMBALANCE_PENALTY
 
-    for entry in schedule:
-        key = (entry['professor_id'], entry['day'])
-        prof_day_hours[key] = prof_day_hours.get(key, 0) + 1
-        prof_week_hours[entry['professor_id']] = prof_week_hours.get(entry['professor_id'], 0) + 1
+    return conflicts
 
-    for (prof, day), hours in prof_day_hours.items():
-        if hours > 5:  # more than 5 hours in a single day
-            conflicts += (hours - 5) * 20
 
-    for prof, total_hours in prof_week_hours.items():
-        diff = abs(20 - total_hours)
-        conflicts += diff * 5
+def fitness(schedule, data):
+    index = data.get('enrollment_index')
+    if index is None:
+        index = build_enrollment_index(data['enrollments'])
+
+    # Entries placed outside the slot table get an ad-hoc table of their own intervals
+    intervals = [(e['day'], e['start_time'], e['end_time']) for e in schedule]
+    slot_table = data.get('slot_table')
+    if slot_table is None or any(key not in slot_table['index'] for key in intervals):
+        slot_table = build_slot_table(
+            [{'day': d, 'start_time': s, 'end_time': e} for d, s, e in dict.fromkeys(intervals)]
+        )
 
-    return conflicts
+    n = len(schedule)
+    return score_entries(
+        index,
+        slot_table,
+        course_layout(np.fromiter(
+            (index['course_index'].get(e['course_id'], -1) for e in schedule), dtype=np.int64, count=n
+        )),
+        bucket_ids([e['professor_id'] for e in schedule]),
+        bucket_ids([e['classroom_id'] for e in schedule]),
+        np.fromiter((slot_table['index'][key] for key in intervals), dtype=np.int64, count=n),
+    )
+
+
+def build_neighbours(index):
+    # Symmetric co-enrollment adjacency in CSR form, over enrollment-index courses
+    sources = np.concatenate([index['pair_a'], index['pair_b']])
+    targets = np.concatenate([index['pair_b'], index['pair_a']])
+    weights = np.concatenate([index['pair_students'], index['pair_students']])
+    order = np.argsort(sources, kind='stable')
+    return {
+        "targets": targets[order],
+        "weights": weights[order],
+        "indptr": np.searchsorted(sources[order], np.arange(len(index['student_counts']) + 1)),
+    }
 
 
+# Genome layout: one flat int array per individual, split into three equal
+# blocks of slot, professor and classroom indices (one position per section).
+SLOT, PROF, ROOM = 0, 1, 2
+GENE_DTYPE = np.int32
 
-def generate_random_schedule(data):
+
+def encode_problem(data):
+    index = data.get('enrollment_index')
+    if index is None:
+        index = build_enrollment_index(data['enrollments'])
+    slot_table = data.get('slot_table')
+    if slot_table is None:
+        slot_table = build_slot_table(data['timetable_slots'])
+
+    gene_course = []
+    for i, course in enumerate(data['courses']):
+        gene_course.extend([i] * course.get('credits', 3))
+    gene_course = np.array(gene_course, dtype=np.int64)
+    course_ids = [c['id'] for c in data['courses']]
+    gene_enrolled = np.array([index['course_index'].get(course_ids[c], -1) for c in gene_course], dtype=np.int64)
+
+    return {
+        "course_ids": course_ids,
+        "professor_ids": [p['id'] for p in data['professors']],
+        "classroom_ids": [c['id'] for c in data['classrooms']],
+        "slots": slot_table['slots'],
+        "slot_table": slot_table,
+        "gene_course": gene_course,
+        "gene_enrolled": gene_enrolled,
+        "layout": course_layout(gene_enrolled),
+        "neighbours": build_neighbours(index),
+        "enrollment_index": index,
+    }
+
+
+def genome_fitness(genome, model):
+    slots, professors, classrooms = genome.reshape(3, -1)
+    return score_entries(
+        model['enrollment_index'], model['slot_table'], model['layout'], professors, classrooms, slots
+    )
+
+
+def decode_genome(genome, model):
+    slots, professors, classrooms = genome.reshape(3, -1).tolist()
     schedule = []
-    for course in data['courses']:
-        prof = random.choice(data['professors'])
-        room = random.choice(data['classrooms'])
-        credits = course.get('credits', 3) if 'credits' in course else 3
-        for _ in range(credits):
-            slot = random.choice(data['timetable_slots'])
-            schedule.append({
-                'course_id': course['id'],
-                'professor_id': prof['id'],
-                'classroom_id': room['id'],
-                'day': slot['day'],
-                'start_time': slot['start_time'],
-                'end_time': slot['end_time']
-            })
+    for course, slot, prof, room in zip(model['gene_course'].tolist(), slots, professors, classrooms):
+        slot = model['slots'][slot]
+        schedule.append({
+            'course_id': model['course_ids'][course],
+            'professor_id': model['professor_ids'][prof],
+            'classroom_id': model['classroom_ids'][room],
+            'day': slot['day'],
+            'start_time': slot['start_time'],
+            'end_time': slot['end_time']
+        })
     return schedule
 
 
-def run_genetic_algorithm(data, population_size=50, generations=100):
-    population = [generate_random_schedule(data) for _ in range(population_size)]
-    best_schedule = None
-    best_fitness = float('inf')
+def encode_schedule(schedule, model):
+    # Inverse of decode_genome() for a schedule of the same model's sections
+    slot_index = model['slot_table']['index']
+    prof_index = {p: i for i, p in enumerate(model['professor_ids'])}
+    room_index = {r: i for i, r in enumerate(model['classroom_ids'])}
+    return np.array([
+        [slot_index[(e['day'], e['start_time'], e['end_time'])] for e in schedule],
+        [prof_index[e['professor_id']] for e in schedule],
+        [room_index[e['classroom_id']] for e in schedule],
+    ], dtype=GENE_DTYPE).reshape(-1)
+
+
+def generate_random_genome(model, rng):
+    # One professor and classroom per course, a fresh slot per credit hour
+    n_courses = len(model['course_ids'])
+    genome = np.empty((3, len(model['gene_course'])), dtype=GENE_DTYPE)
+    genome[SLOT] = rng.integers(len(model['slots']), size=genome.shape[1])
+    genome[PROF] = rng.integers(len(model['professor_ids']), size=n_courses)[model['gene_course']]
+    genome[ROOM] = rng.integers(len(model['classroom_ids']), size=n_courses)[model['gene_course']]
+    return genome.reshape(-1)
+
+
+def build_initializer_context(model):
+    # Static per-run inputs for constructive_genome
+    index = model['enrollment_index']
+    n_courses = len(model['course_ids'])
+    course_enrolled = np.array([index['course_index'].get(c, -1) for c in model['course_ids']], dtype=np.int64)
+
+    neighbours = model['neighbours']
+    indptr = neighbours['indptr']
+
+    students = np.where(course_enrolled >= 0, index['student_counts'][np.maximum(course_enrolled, 0)], 0)
+    degree = np.where(course_enrolled >= 0, np.diff(indptr)[np.maximum(course_enrolled, 0)], 0)
+    return {
+        "course_enrolled": course_enrolled,
+        "course_genes": np.searchsorted(model['gene_course'], np.arange(n_courses + 1)),
+        "students": students,
+        "degree": degree,
+        "neighbours": neighbours['targets'],
+        "neighbour_weights": neighbours['weights'].astype(np.float64),
+        "indptr": indptr,
+    }
+
+
+HARD_CONSTRAINT_WEIGHT = 1e9
+
+
+def constructive_genome(model, context, rng):
+    # Greedy most-constrained-first placement: courses with more credits,
+    # students and co-enrolled courses go first; each hour takes the slot
+    # with the smallest marginal penalty given everything placed so far.
+    # Random jitter below one penalty unit breaks ties for diversity.
+    slot_table = model['slot_table']
+    overlap = slot_table['overlap_weights']
+    day = slot_table['day']
+    n_slots = len(slot_table['slots'])
+    n_profs = len(model['professor_ids'])
+    n_rooms = len(model['classroom_ids'])
+    course_genes = context['course_genes']
+    credits = np.diff(course_genes)
+
+    prof_busy = np.zeros((n_profs, n_slots))
+    room_busy = np.zeros((n_rooms, n_slots))
+    prof_day_hours = np.zeros((n_profs, slot_table['n_days']))
+    prof_week_hours = np.zeros(n_profs)
+    room_hours = np.zeros(n_rooms)
+    student_clash = np.zeros((len(context['indptr']) - 1, n_slots))
+
+    genome = np.empty((3, len(model['gene_course'])), dtype=GENE_DTYPE)
+    order = np.lexsort((rng.random(len(credits)), -context['degree'], -context['students'], -credits))
+    for course in order:
+        if not credits[course]:
+            continue
+        prof = int(np.argmin(prof_week_hours + rng.random(n_profs)))
+        room = int(np.argmin(room_hours + rng.random(n_rooms)))
+        enrolled = context['course_enrolled'][course]
+        students = context['students'][course]
+        course_day_hours = np.zeros(slot_table['n_days'])
+
+        for gene in range(course_genes[course], course_genes[course + 1]):
+            # Professor/room clashes are hard: never traded for soft savings while a free slot exists
+            cost = (
+                HARD_CONSTRAINT_WEIGHT * (prof_busy[prof] + room_busy[room])
+                + SAME_DAY_REPEAT_PENALTY * 2 * students * course_day_hours[day]
+                + PROFESSOR_DAY_OVERLOAD_PENALTY * (prof_day_hours[prof, day] >= MAX_PROFESSOR_DAY_HOURS)
+                + rng.random(n_slots)
+            )
+            if enrolled >= 0:
+                cost += STUDENT_CLASH_PENALTY * student_clash[enrolled]
+            slot = int(np.argmin(cost))
+
+            genome[:, gene] = (slot, prof, room)
+            prof_busy[prof] += overlap[slot]
+            room_busy[room] += overlap[slot]
+            prof_day_hours[prof, day[slot]] += 1
+            prof_week_hours[prof] += 1
+            room_hours[room] += 1
+            course_day_hours[day[slot]] += 1
+            if enrolled >= 0:
+                start, stop = context['indptr'][enrolled], context['indptr'][enrolled + 1]
+                student_clash[context['neighbours'][start:stop]] += (
+                    context['neighbour_weights'][start:stop, None] * overlap[slot]
+                )
+    return genome.reshape(-1)
+
+
+def initial_population(model, population_size, rng, initializer="random"):
+    if initializer == "constructive":
+        context = build_initializer_context(model)
+        return np.stack([constructive_genome(model, context, rng) for _ in range(population_size)])
+    return np.stack([generate_random_genome(model, rng) for _ in range(population_size)])
+
+
+def generate_random_schedule(data):
+    model = encode_problem(data)
+    return decode_genome(generate_random_genome(model, np.random.default_rng()), model)
+
+
+def professor_week_penalty(hours):
+    # Only professors that teach at all are held to the weekly target
+    return abs(TARGET_PROFESSOR_WEEK_HOURS - hours) * PROFESSOR_WEEK_IMBALANCE_PENALTY if hours else 0
+
+
+# Penalty terms of the fitness, as broken down by FitnessState.components()
+FITNESS_COMPONENTS = (
+    "professor_clashes", "classroom_clashes", "same_day_repeats", "student_clashes",
+    "professor_day_overload", "professor_week_imbalance",
+)
+
 
-    for _ in range(generations):
-        scored = [(fitness(schedule, data), schedule) for schedule in population]
-        scored.sort(key=lambda x: x[0])
-        best_current_fitness, best_current_schedule = scored[0]
-        if best_current_fitness < best_fitness:
-            best_fitness = best_current_fitness
-            best_schedule = best_current_schedule
-            if best_fitness == 0:
+class FitnessState:
+    # Penalty counters for one genome. delta() prices a single-section move
+    # and move() applies it, both touching only the buckets that move affects.
+    # Counters are also kept per half of the gene range, split where breed()
+    # crosses over, so crossover() can sum one half from each parent.
+    COUNTERS = ("prof_busy", "room_busy", "prof_day", "prof_week", "course_day", "exposure")
+
+    def __init__(self, model, genome=None):
+        slot_table = model['slot_table']
+        index = model['enrollment_index']
+        self.model = model
+        self.overlap = slot_table['overlap_counts']
+        self.day = slot_table['day']
+        self.gene_enrolled = model['gene_enrolled']
+        self.student_counts = index['student_counts']
+        self.neighbours = model['neighbours']
+        self.split = len(model['gene_course']) // 2
+        if genome is None:
+            return  # filled in by crossover()
+
+        self.genes = genome.reshape(3, -1).copy()
+        self.halves = (self._count(0, self.split), self._count(self.split, self.genes.shape[1]))
+        self._combine()
+
+    @classmethod
+    def crossover(cls, first, second):
+        # Child with first's genes before the split and second's from it on
+        child = cls(first.model)
+        child.genes = np.concatenate([first.genes[:, :child.split], second.genes[:, child.split:]], axis=1)
+        child.halves = tuple(
+            {name: half[name].copy() for name in cls.COUNTERS}
+            for half in (first.halves[0], second.halves[1])
+        )
+        child._combine()
+        return child
+
+    def _count(self, start, stop):
+        model = self.model
+        n_slots = len(model['slots'])
+        n_days = model['slot_table']['n_days']
+        n_profs = len(model['professor_ids'])
+        n_rooms = len(model['classroom_ids'])
+        n_enrolled = len(self.student_counts)
+        slots, profs, rooms = self.genes[:, start:stop]
+        days = self.day[slots]
+
+        # busy[owner, x]: how many of the owner's entries overlap slot x
+        prof_busy = np.bincount(profs * n_slots + slots, minlength=n_profs * n_slots)\
+            .reshape(n_profs, n_slots) @ self.overlap
+        room_busy = np.bincount(rooms * n_slots + slots, minlength=n_rooms * n_slots)\
+            .reshape(n_rooms, n_slots) @ self.overlap
+        prof_day = np.bincount(profs * n_days + days, minlength=n_profs * n_days).reshape(n_profs, n_days)
+
+        courses = self.gene_enrolled[start:stop]
+        enrolled = courses >= 0
+        courses = courses[enrolled]
+        course_day = np.bincount(courses * n_days + days[enrolled], minlength=n_enrolled * n_days)\
+            .reshape(n_enrolled, n_days)
+        # exposure[c, x]: students course c would clash with if one of its entries sat in slot x.
+        # Every entry adds its co-enrollment weights to its neighbours' row at its own slot.
+        indptr = self.neighbours['indptr']
+        degree = indptr[courses + 1] - indptr[courses]
+        edges = np.repeat(indptr[courses] - np.cumsum(degree) + degree, degree) + np.arange(degree.sum())
+        neighbour_slots = np.bincount(
+            self.neighbours['targets'][edges] * n_slots + np.repeat(slots[enrolled], degree),
+            weights=self.neighbours['weights'][edges], minlength=n_enrolled * n_slots,
+        )
+        exposure = neighbour_slots.astype(np.int64).reshape(n_enrolled, n_slots) @ self.overlap
+
+        return {
+            "prof_busy": prof_busy,
+            "room_busy": room_busy,
+            "prof_day": prof_day,
+            "prof_week": prof_day.sum(axis=1),
+            "course_day": course_day,
+            "exposure": exposure,
+        }
+
+    def _combine(self):
+        self.counters = {name: self.halves[0][name] + self.halves[1][name] for name in self.COUNTERS}
+        self.total = self._total()
+
+    def components(self):
+        # Same terms as score_entries(), read off the counters instead of recounted
+        counters = self.counters
+        slots, profs, rooms = self.genes
+        if not len(slots):
+            return dict.fromkeys(FITNESS_COMPONENTS, 0)
+        own = self.overlap[slots, slots].sum()
+        repeats = counters['course_day']
+        enrolled = self.gene_enrolled >= 0
+        return {
+            "professor_clashes": int(PROFESSOR_CLASH_PENALTY * ((counters['prof_busy'][profs, slots].sum() - own) // 2)),
+            "classroom_clashes": int(CLASSROOM_CLASH_PENALTY * ((counters['room_busy'][rooms, slots].sum() - own) // 2)),
+            "same_day_repeats": int(SAME_DAY_REPEAT_PENALTY * (self.student_counts[:, None] * repeats * (repeats - 1)).sum()),
+            "student_clashes": int(
+                STUDENT_CLASH_PENALTY * (counters['exposure'][self.gene_enrolled[enrolled], slots[enrolled]].sum() // 2)
+            ),
+            "professor_day_overload": int(
+                PROFESSOR_DAY_OVERLOAD_PENALTY * np.clip(counters['prof_day'] - MAX_PROFESSOR_DAY_HOURS, 0, None).sum()
+            ),
+            "professor_week_imbalance": int(sum(professor_week_penalty(hours) for hours in counters['prof_week'].tolist())),
+        }
+
+    def _total(self):
+        return sum(self.components().values())
+
+    @property
+    def genome(self):
+        return self.genes.reshape(-1).copy()
+
+    def delta(self, gene, slot, prof, room):
+        s, p, r = (int(v) for v in self.genes[:, gene])
+        counters = self.counters
+        overlap = self.overlap
+        day = self.day
+        change = 0
+
+        if (p, s) != (prof, slot):
+            prof_busy = counters['prof_busy']
+            lost = prof_busy[p, s] - overlap[s, s]
+            gained = prof_busy[prof, slot] - (overlap[s, slot] if prof == p else 0)
+            change += PROFESSOR_CLASH_PENALTY * (gained - lost)
+            if (p, day[s]) != (prof, day[slot]):
+                if counters['prof_day'][p, day[s]] > MAX_PROFESSOR_DAY_HOURS:
+                    change -= PROFESSOR_DAY_OVERLOAD_PENALTY
+                if counters['prof_day'][prof, day[slot]] >= MAX_PROFESSOR_DAY_HOURS:
+                    change += PROFESSOR_DAY_OVERLOAD_PENALTY
+            if p != prof:
+                week = counters['prof_week']
+                change += professor_week_penalty(week[p] - 1) - professor_week_penalty(week[p])
+                change += professor_week_penalty(week[prof] + 1) - professor_week_penalty(week[prof])
+
+        if (r, s) != (room, slot):
+            room_busy = counters['room_busy']
+            lost = room_busy[r, s] - overlap[s, s]
+            gained = room_busy[room, slot] - (overlap[s, slot] if room == r else 0)
+            change += CLASSROOM_CLASH_PENALTY * (gained - lost)
+
+        course = self.gene_enrolled[gene]
+        if course >= 0 and slot != s:
+            if day[s] != day[slot]:
+                course_day = counters['course_day']
+                repeats = course_day[course, day[slot]] - (course_day[course, day[s]] - 1)
+                change += SAME_DAY_REPEAT_PENALTY * self.student_counts[course] * 2 * repeats
+            exposure = counters['exposure']
+            change += STUDENT_CLASH_PENALTY * (exposure[course, slot] - exposure[course, s])
+
+        return int(change)
+
+    def move(self, gene, slot, prof, room):
+        change = self.delta(gene, slot, prof, room)
+        s, p, r = (int(v) for v in self.genes[:, gene])
+        overlap = self.overlap
+        day = self.day
+        course = self.gene_enrolled[gene]
+        if course >= 0 and slot != s:
+            start, stop = self.neighbours['indptr'][course], self.neighbours['indptr'][course + 1]
+            neighbours = self.neighbours['targets'][start:stop]
+            shift = self.neighbours['weights'][start:stop, None] * (overlap[slot] - overlap[s])
+
+        for counters in (self.counters, self.halves[gene >= self.split]):
+            counters['prof_busy'][p] -= overlap[s]
+            counters['prof_busy'][prof] += overlap[slot]
+            counters['room_busy'][r] -= overlap[s]
+            counters['room_busy'][room] += overlap[slot]
+            counters['prof_day'][p, day[s]] -= 1
+            counters['prof_day'][prof, day[slot]] += 1
+            counters['prof_week'][p] -= 1
+            counters['prof_week'][prof] += 1
+            if course >= 0 and slot != s:
+                counters['course_day'][course, day[s]] -= 1
+                counters['course_day'][course, day[slot]] += 1
+                counters['exposure'][neighbours] += shift
+
+        self.genes[:, gene] = (slot, prof, room)
+        self.total += change
+        return change
+
+
+def solver_stats(genome, fitness, model, **extra):
+    # Progress details for a solver's best genome: hard conflicts are professor
+    # and classroom clashes, everything else in the fitness is soft penalty
+    slots, professors, classrooms = genome.reshape(3, -1)
+    slot_table = model['slot_table']
+    professor_clashes = count_slot_clashes(professors, slots, slot_table)
+    classroom_clashes = count_slot_clashes(classrooms, slots, slot_table)
+    hard_penalty = PROFESSOR_CLASH_PENALTY * professor_clashes + CLASSROOM_CLASH_PENALTY * classroom_clashes
+    return {
+        "hard_conflicts": professor_clashes + classroom_clashes,
+        "soft_penalty": float(fitness) - hard_penalty,
+        **extra,
+    }
+
+
+def breed(population, scores, model, rng):
+    n_genes = len(model['gene_course'])
+    population_size = len(population)
+    order = np.argsort(scores, kind='stable')
+
+    # Fancy indexing copies, so children never alias the surviving parents
+    survivors = population[order[:population_size // 2]]
+    n_children = population_size - len(survivors)
+    children = survivors[rng.integers(len(survivors), size=n_children)].reshape(n_children, 3, n_genes)
+    second_parents = survivors[rng.integers(len(survivors), size=n_children)].reshape(n_children, 3, n_genes)
+    crossover_point = n_genes // 2
+    children[:, :, crossover_point:] = second_parents[:, :, crossover_point:]
+
+    rows = np.arange(n_children)
+    idx = rng.integers(n_genes, size=n_children)
+    children[rows, PROF, idx] = rng.integers(len(model['professor_ids']), size=n_children)
+    children[rows, ROOM, idx] = rng.integers(len(model['classroom_ids']), size=n_children)
+    children[rows, SLOT, idx] = rng.integers(len(model['slots']), size=n_children)
+
+    return np.concatenate([survivors, children.reshape(n_children, -1)])
+
+
+def breed_states(states, scores, model, rng):
+    # breed() for FitnessState individuals: children are built with crossover()
+    # and one move(), so nobody has to be re-scored from scratch
+    n_genes = len(model['gene_course'])
+    order = np.argsort(scores, kind='stable')
+
+    survivors = [states[i] for i in order[:len(states) // 2]]
+    n_children = len(states) - len(survivors)
+    first_parents = rng.integers(len(survivors), size=n_children)
+    second_parents = rng.integers(len(survivors), size=n_children)
+
+    idx = rng.integers(n_genes, size=n_children)
+    profs = rng.integers(len(model['professor_ids']), size=n_children)
+    rooms = rng.integers(len(model['classroom_ids']), size=n_children)
+    slots = rng.integers(len(model['slots']), size=n_children)
+
+    children = []
+    for i in range(n_children):
+        child = FitnessState.crossover(survivors[first_parents[i]], survivors[second_parents[i]])
+        child.move(int(idx[i]), int(slots[i]), int(profs[i]), int(rooms[i]))
+        children.append(child)
+    return survivors + children
+
+
+# Reference data for pool workers, shipped once by the pool initializer
+# instead of being pickled with every task.
+_worker_model = None
+
+
+def _init_worker(model):
+    global _worker_model
+    _worker_model = model
+
+
+def _score_chunk(genomes):
+    return [genome_fitness(genome, _worker_model) for genome in genomes]
+
+
+def score_population(population, model, pool=None, workers=1):
+    if pool is None:
+        return np.array([genome_fitness(genome, model) for genome in population])
+    chunks = np.array_split(population, workers)
+    return np.array([score for chunk in pool.map(_score_chunk, chunks) for score in chunk])
+
+
+def evolve(
+    population, generations, model, rng, pool=None, workers=1, progress=None, deadline=None, stagnation=None
+):
+    best_genome = None
+    best_fitness = float('inf')
+    improved_at = 0
+    # In-process runs score incrementally; pool workers re-score whole genomes
+    states = [FitnessState(model, genome) for genome in population] if pool is None else None
+    if states is not None:
+        fitness_evaluations.inc(len(states), "full")
+
+    for generation in range(1, generations + 1):
+        started = perf_counter()
+        if states is None:
+            scores = score_population(population, model, pool, workers)
+            fitness_evaluations.inc(len(scores), "full")
+        else:
+            scores = np.array([state.total for state in states])
+        best_idx = int(np.argmin(scores))
+        if scores[best_idx] < best_fitness:
+            best_fitness = scores[best_idx]
+            best_genome = population[best_idx].copy() if states is None else states[best_idx].genome
+            improved_at = generation
+        if progress and progress(generation, best_fitness, solver_stats(
+            best_genome, best_fitness, model, mean_fitness=float(scores.mean()), worst_fitness=float(scores.max())
+        )):
+            break
+        if best_fitness == 0 or (deadline is not None and monotonic() >= deadline):
+            break
+        if stagnation is not None and generation - improved_at >= stagnation:
+            break
+        if states is None:
+            population = breed(population, scores, model, rng)
+        else:
+            states = breed_states(states, scores, model, rng)
+            fitness_evaluations.inc(len(states) - len(states) // 2, "incremental")
+        solver_iteration_seconds.observe(perf_counter() - started, "genetic")
+
+    if states is not None:
+        population = np.stack([state.genome for state in states])
+    return population, best_genome, best_fitness
+
+
+def _evolve_island(population, generations, seed, time_budget=None, stagnation=None):
+    # monotonic() readings are per process, so the deadline is rebuilt from the seconds left.
+    # Every generation's progress figures come back too, for the parent to replay.
+    deadline = monotonic() + time_budget if time_budget is not None else None
+    history = []
+
+    def record(generation, best_fitness, stats):
+        history.append({"best_fitness": float(best_fitness), **stats})
+
+    population, best_genome, best_fitness = evolve(
+        population, generations, _worker_model, np.random.default_rng(seed),
+        progress=record, deadline=deadline, stagnation=stagnation,
+    )
+    return population, best_genome, best_fitness, history
+
+
+def replay_island_progress(progress, generation, histories):
+    # Reports an epoch generation by generation, as if the islands were one
+    # population: the leading island's figures with the mean and worst taken
+    # over all of them. Islands that stopped early repeat their last generation.
+    # Returns True as soon as progress asks the run to stop.
+    for offset in range(max(len(history) for history in histories)):
+        rows = [history[min(offset, len(history) - 1)] for history in histories]
+        leader = min(rows, key=itemgetter("best_fitness"))
+        stats = {k: v for k, v in leader.items() if k != "best_fitness"}
+        stats["mean_fitness"] = float(np.mean([row["mean_fitness"] for row in rows]))
+        stats["worst_fitness"] = max(row["worst_fitness"] for row in rows)
+        if progress(generation + offset + 1, leader["best_fitness"], stats):
+            return True
+    return False
+
+
+def open_worker_pool(model, workers):
+    # spawn rather than fork: the API process is multi-threaded
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model,),
+    )
+
+
+def run_genetic_algorithm(
+    data, population_size=50, generations=100, workers=1, islands=1, migration_interval=10, progress=None,
+    initializer="random", time_budget=None, stagnation=None, seed=None,
+):
+    # progress(generation, best_fitness, stats) is called as the run advances; raising from it
+    # aborts the run, returning True from it stops the run with the best schedule so far.
+    # time_budget (seconds) stops the run after the generation in which it runs out, and
+    # stagnation after that many generations without improvement. With a seed the run
+    # is reproducible as long as no time_budget or stop request cuts it short.
+    deadline = monotonic() + time_budget if time_budget is not None else None
+    model = encode_problem(data)
+    if not len(model['gene_course']):
+        return []
+    rng = np.random.default_rng(seed)
+
+    if islands <= 1:
+        # 2-D population: one row per individual
+        population = initial_population(model, population_size, rng, initializer)
+        if workers <= 1:
+            best_genome = evolve(
+                population, generations, model, rng, progress=progress, deadline=deadline, stagnation=stagnation
+            )[1]
+        else:
+            with open_worker_pool(model, workers) as pool:
+                best_genome = evolve(
+                    population, generations, model, rng, pool, workers, progress, deadline, stagnation
+                )[1]
+        return decode_genome(best_genome, model)
+
+    # Island model: every island evolves its own population_size individuals and,
+    # every migration_interval generations, sends its best one to the next island
+    populations = [initial_population(model, population_size, rng, initializer) for _ in range(islands)]
+    best_genome = None
+    best_fitness = float('inf')
+    improved_at = 0
+    with open_worker_pool(model, min(workers, islands)) as pool:
+        remaining = generations
+        while remaining > 0:
+            epoch = min(migration_interval, remaining)
+            remaining -= epoch
+            time_left = deadline - monotonic() if deadline is not None else None
+            started = perf_counter()
+            futures = [
+                pool.submit(_evolve_island, population, epoch, int(rng.integers(2**32)), time_left, stagnation)
+                for population in populations
+            ]
+            results = [f.result() for f in futures]
+            populations = [population for population, _, _, _ in results]
+            # Islands evolve in other processes; record the epoch's average generation
+            solver_iteration_seconds.observe((perf_counter() - started) / epoch, "genetic")
+            fitness_evaluations.inc(islands * population_size * epoch, "incremental")
+            for _, island_best, island_fitness, _ in results:
+                if island_fitness < best_fitness:
+                    best_fitness = island_fitness
+                    best_genome = island_best
+                    improved_at = generations - remaining
+            if progress and replay_island_progress(
+                progress, generations - remaining - epoch, [history for _, _, _, history in results]
+            ):
+                break
+            if best_fitness == 0 or (deadline is not None and monotonic() >= deadline):
                 break
-        next_gen = scored[:population_size // 2]
-        new_population = [s for _, s in next_gen]
-        while len(new_population) < population_size:
-            parent1 = random.choice(new_population)
-            parent2 = random.choice(new_population)
-            child = []
-            crossover_point = len(parent1) // 2
-            child.extend(parent1[:crossover_point])
-            child.extend(parent2[crossover_point:])
-            idx = random.randint(0, len(child) - 1)
-            child[idx]['professor_id'] = random.choice(data['professors'])['id']
-            child[idx]['classroom_id'] = random.choice(data['classrooms'])['id']
-            slot = random.choice(data['timetable_slots'])
-            child[idx]['day'] = slot['day']
-            child[idx]['start_time'] = slot['start_time']
-            child[idx]['end_time'] = slot['end_time']
-            new_population.append(child)
-        population = new_population
-    return best_schedule
-
-
-def persist_schedule(schedule, job_id, term='Fall 2025'):
-    serializable_schedule = convert_to_serializable(schedule)
+            if stagnation is not None and generations - remaining - improved_at >= stagnation:
+                break
+            # Ring migration; the last row of a bred population is always a child
+            for i, (_, island_best, _, _) in enumerate(results):
+                populations[(i + 1) % islands][-1] = island_best
+    return decode_genome(best_genome, model)
+
+
+def anneal(state, movable, rng, time_budget=None, max_iterations=None, progress=None, end_temperature=1.0):
+    # Simulated annealing over one-section moves (new slot, room or professor)
+    # and slot swaps between two sections, priced with FitnessState deltas.
+    # Only the sections listed in movable are touched. Returns the best genome seen.
+    model = state.model
+    n_slots = len(model['slots'])
+    n_profs = len(model['professor_ids'])
+    n_rooms = len(model['classroom_ids'])
+    best_genome = state.genome
+    best_fitness = state.total
+
+    # Start warm enough to accept the cheapest uphill moves about half the time;
+    # clash-sized moves are rejected almost from the start
+    sample = movable[rng.integers(len(movable), size=200)]
+    deltas = [state.delta(g, int(rng.integers(n_slots)), *state.genes[1:, g]) for g in sample]
+    uphill = [d for d in deltas if d > 0] or [end_temperature]
+    start_temperature = max(float(np.percentile(uphill, 10)) / np.log(2), end_temperature)
+    temperature = start_temperature
+
+    started = monotonic()
+    batch = 1000
+    iteration = 0
+    while best_fitness > 0:
+        if max_iterations is not None and iteration >= max_iterations:
+            break
+        elapsed = monotonic() - started
+        if time_budget is not None and elapsed >= time_budget:
+            break
+        if progress and progress(iteration, best_fitness, solver_stats(
+            best_genome, best_fitness, model, current_fitness=state.total
+        )):
+            break
+        if time_budget is not None:
+            # Geometric cooling over the wall-clock budget
+            temperature = start_temperature * (end_temperature / start_temperature) ** (elapsed / time_budget)
+        elif max_iterations:
+            temperature = start_temperature * (end_temperature / start_temperature) ** (iteration / max_iterations)
+
+        genes = movable[rng.integers(len(movable), size=(batch, 2))]
+        kinds = rng.random(batch)
+        new_slots = rng.integers(n_slots, size=batch)
+        new_profs = rng.integers(n_profs, size=batch)
+        new_rooms = rng.integers(n_rooms, size=batch)
+        thresholds = -temperature * np.log(rng.random(batch))
+        batch_started = perf_counter()
+
+        for i in range(batch):
+            gene = int(genes[i, 0])
+            slot, prof, room = (int(v) for v in state.genes[:, gene])
+            if kinds[i] < 0.2:
+                # Swap the slots of two sections
+                other = int(genes[i, 1])
+                other_slot, other_prof, other_room = (int(v) for v in state.genes[:, other])
+                change = state.move(gene, other_slot, prof, room)
+                change += state.move(other, slot, other_prof, other_room)
+                if change > thresholds[i]:
+                    state.move(other, other_slot, other_prof, other_room)
+                    state.move(gene, slot, prof, room)
+                    continue
+            else:
+                if kinds[i] < 0.6:
+                    slot = int(new_slots[i])
+                elif kinds[i] < 0.8:
+                    room = int(new_rooms[i])
+                else:
+                    prof = int(new_profs[i])
+                if state.delta(gene, slot, prof, room) > thresholds[i]:
+                    continue
+                state.move(gene, slot, prof, room)
+
+            if state.total < best_fitness:
+                best_fitness = state.total
+                best_genome = state.genome
+                if best_fitness == 0:
+                    break
+        iteration += batch
+        solver_iteration_seconds.observe(perf_counter() - batch_started, "annealing")
+        fitness_evaluations.inc(batch, "delta")
+
+    if progress:
+        progress(iteration, best_fitness, solver_stats(best_genome, best_fitness, model, current_fitness=state.total))
+    return best_genome
+
+
+def run_simulated_annealing(
+    data, time_budget=60, max_iterations=None, initializer="random", progress=None, end_temperature=1.0, seed=None
+):
+    # Cooling follows the clock under a time_budget, so only max_iterations runs repeat exactly
+    model = encode_problem(data)
+    n_genes = len(model['gene_course'])
+    if not n_genes:
+        return []
+    rng = np.random.default_rng(seed)
+    state = FitnessState(model, initial_population(model, 1, rng, initializer)[0])
+    best_genome = anneal(state, np.arange(n_genes), rng, time_budget, max_iterations, progress, end_temperature)
+    return decode_genome(best_genome, model)
+
+
+# Repair runs re-place only the sections a data change touched; the rest of
+# the previous version is pinned, so work scales with the size of the change
+REPAIR_ITERATIONS_PER_SECTION = int(os.getenv("REPAIR_ITERATIONS_PER_SECTION", "2000"))
+
+
+def warm_start_genome(model, previous_schedule, rng):
+    # Carry the previous version's rows over onto the current sections, course
+    # by course. Sections with no usable row (new sections, or rows whose
+    # professor, classroom or slot is gone) come back flagged as free.
+    genome = generate_random_genome(model, rng).reshape(3, -1)
+    free = np.ones(genome.shape[1], dtype=bool)
+    prof_index = {prof_id: i for i, prof_id in enumerate(model['professor_ids'])}
+    room_index = {room_id: i for i, room_id in enumerate(model['classroom_ids'])}
+    slot_index = {}
+    for i, slot in enumerate(model['slots']):
+        slot_index.setdefault((slot['day'], time_to_minutes(slot['start_time']), time_to_minutes(slot['end_time'])), i)
+
+    previous_rows = {}
+    for row in previous_schedule:
+        previous_rows.setdefault(row['course_id'], []).append(row)
+    course_genes = np.searchsorted(model['gene_course'], np.arange(len(model['course_ids']) + 1))
+    for course, course_id in enumerate(model['course_ids']):
+        genes = range(course_genes[course], course_genes[course + 1])
+        for gene, row in zip(genes, previous_rows.get(course_id, ())):
+            slot = slot_index.get((row['day'], time_to_minutes(row['start_time']), time_to_minutes(row['end_time'])))
+            prof = prof_index.get(row['professor_id'])
+            room = room_index.get(row['classroom_id'])
+            if slot is not None and prof is not None and room is not None:
+                genome[:, gene] = (slot, prof, room)
+                free[gene] = False
+    return genome.reshape(-1), free
+
+
+def clashing_entries(owners, slots, slot_table):
+    # Per entry: does another entry of the same owner overlap it?
+    n_slots = len(slot_table['slots'])
+    counts = np.bincount(owners * n_slots + slots, minlength=(int(owners.max()) + 1) * n_slots).reshape(-1, n_slots)
+    overlap = slot_table['overlap_counts']
+    return (counts @ overlap)[owners, slots] > overlap[slots, slots]
+
+
+def run_repair(data, previous_version_id=None, time_budget=None, progress=None, seed=None):
+    # Warm start from the rows of previous_version_id, handed over in
+    # data['previous_schedule']; pinned sections never move
+    model = encode_problem(data)
+    n_genes = len(model['gene_course'])
+    if not n_genes:
+        return []
+    rng = np.random.default_rng(seed)
+    genome, free = warm_start_genome(model, data['previous_schedule'], rng)
+
+    # Pinned sections that now clash with each other are infeasible and get re-placed too
+    slots, profs, rooms = genome.reshape(3, -1)
+    pinned = np.flatnonzero(~free)
+    if len(pinned):
+        slot_table = model['slot_table']
+        free[pinned] |= clashing_entries(profs[pinned], slots[pinned], slot_table)
+        free[pinned] |= clashing_entries(rooms[pinned], slots[pinned], slot_table)
+    movable = np.flatnonzero(free)
+    if not len(movable):
+        return decode_genome(genome, model)
+
+    # Greedy first placement, one coordinate at a time, then anneal the free sections
+    state = FitnessState(model, genome)
+    n_slots, n_profs, n_rooms = len(model['slots']), len(model['professor_ids']), len(model['classroom_ids'])
+    for gene in movable.tolist():
+        slot, prof, room = (int(v) for v in state.genes[:, gene])
+        slot = min(range(n_slots), key=lambda s: state.delta(gene, s, prof, room))
+        room = min(range(n_rooms), key=lambda r: state.delta(gene, slot, prof, r))
+        prof = min(range(n_profs), key=lambda p: state.delta(gene, slot, p, room))
+        state.move(gene, slot, prof, room)
+
+    best_genome = anneal(
+        state, movable, rng, time_budget, REPAIR_ITERATIONS_PER_SECTION * len(movable), progress
+    )
+    return decode_genome(best_genome, model)
+
+
+def schedule_changes(previous_schedule, schedule):
+    # Row-level diff between two versions, matching rows course by course
+    def placements(rows):
+        counts = {}
+        for row in rows:
+            key = (row['course_id'], row['professor_id'], row['classroom_id'], row['day'],
+                   time_to_minutes(row['start_time']), time_to_minutes(row['end_time']))
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    before, after = placements(previous_schedule), placements(schedule)
+    kept_by_course, before_by_course, after_by_course = {}, {}, {}
+    for key, count in before.items():
+        before_by_course[key[0]] = before_by_course.get(key[0], 0) + count
+        kept_by_course[key[0]] = kept_by_course.get(key[0], 0) + min(count, after.get(key, 0))
+    for key, count in after.items():
+        after_by_course[key[0]] = after_by_course.get(key[0], 0) + count
+
+    changes = {"kept": 0, "moved": 0, "added": 0, "removed": 0}
+    for course in before_by_course.keys() | after_by_course.keys():
+        old, new, kept = before_by_course.get(course, 0), after_by_course.get(course, 0), kept_by_course.get(course, 0)
+        changes["kept"] += kept
+        changes["moved"] += min(old, new) - kept
+        changes["added"] += max(new - old, 0)
+        changes["removed"] += max(old - new, 0)
+    return changes
+
+
+# Every solver takes the fetch_all_data() snapshot plus its own keyword
+# parameters (all accept time_budget in seconds, a seed and a progress
+# callback) and returns a schedule as a list of entry dicts.
+SOLVERS = {
+    "genetic": run_genetic_algorithm,
+    "annealing": run_simulated_annealing,
+    "repair": run_repair,
+}
+
+
+def input_fingerprint(data, solver, solver_params):
+    # Equal reference tables, solver and parameters give equal fingerprints.
+    # The seed is left out so a request without one can reuse any seeded
+    # result; fingerprint_match() compares seeds separately.
+    digest = hashlib.sha256()
+    for name in REFERENCE_TABLES:
+        digest.update(data[f"{name}_digest"].encode())
+    params = {k: v for k, v in solver_params.items() if k != "seed"}
+    digest.update(json.dumps([solver, params], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def reproducible_run(solver, solver_params, seconds):
+    # Only runs a rerun would repeat exactly keep their fingerprint. Annealing
+    # and repair cool on the clock under a time_budget; the GA only stops on
+    # it, so a GA run that finished inside its budget still counts.
+    time_budget = solver_params.get("time_budget")
+    if time_budget is None:
+        return True
+    return solver == "genetic" and seconds < time_budget
+
+
+def run_scenario(data, solver, solver_params):
+    # One what-if run in a scenario worker process: the schedule plus the
+    # comparison figures for it
+    started = perf_counter()
+    schedule = SOLVERS[solver](data, **solver_params)
+    seconds = perf_counter() - started
+    model = encode_problem(data)
+    genome = encode_schedule(schedule, model)
+    state = FitnessState(model, genome)
+    return schedule, {
+        "fitness": state.total,
+        **solver_stats(genome, state.total, model),
+        "components": state.components(),
+        "sections": len(schedule),
+        "seconds": round(seconds, 3),
+    }
 
+
+def fingerprint_match(versions, seed=None):
+    # versions: completed timetable_versions rows sharing a fingerprint, newest first
+    for version in versions:
+        if seed is None or (version.get("solver_params") or {}).get("seed") == seed:
+            return version
+    return None
+
+
+# persist_schedule writes in chunks of PERSIST_CHUNK_SIZE rows with at most
+# PERSIST_MAX_IN_FLIGHT requests open at once; a failing chunk is retried
+# PERSIST_RETRIES times with exponential backoff before the version is marked incomplete
+PERSIST_CHUNK_SIZE = int(os.getenv("PERSIST_CHUNK_SIZE", "500"))
+PERSIST_MAX_IN_FLIGHT = int(os.getenv("PERSIST_MAX_IN_FLIGHT", "4"))
+PERSIST_RETRIES = int(os.getenv("PERSIST_RETRIES", "3"))
+
+# Inserts are not idempotent, so only failures that prove the chunk was never
+# written are retried: the connection was never made, or PostgREST answered
+# that it could not reach the database (PGRST00x) or Postgres rolled the
+# transaction back (class 40). Timeouts and dropped responses after the body
+# was sent may have committed, and fail the version instead of duplicating rows.
+UNSENT_REQUEST_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def chunk_never_written(error):
+    if isinstance(error, UNSENT_REQUEST_ERRORS):
+        return True
+    return isinstance(error, APIError) and str(error.code or "").startswith(("PGRST00", "40"))
+
+
+def insert_chunk(table, chunk):
+    for attempt in range(PERSIST_RETRIES + 1):
+        try:
+            supabase.table(table).insert(chunk, returning="minimal").execute()
+            return len(chunk)
+        except Exception as error:
+            if attempt == PERSIST_RETRIES or not chunk_never_written(error):
+                raise
+            sleep(0.5 * 2 ** attempt)
+
+
+def write_rows(table, rows):
+    started = monotonic()
+    chunks = [rows[i:i + PERSIST_CHUNK_SIZE] for i in range(0, len(rows), PERSIST_CHUNK_SIZE)]
+    with ThreadPoolExecutor(max_workers=PERSIST_MAX_IN_FLIGHT) as pool:
+        written = sum(pool.map(lambda chunk: insert_chunk(table, chunk), chunks))
+    return {"rows": written, "chunks": len(chunks), "seconds": round(monotonic() - started, 3)}
+
+
+# Versions are stored as deltas against their base, the term's previous
+# completed version: schedule_rows holds the rows a version adds and, flagged
+# removed, the ones it drops. A full snapshot is written for a term's first
+# version, every SNAPSHOT_INTERVAL versions, and whenever the delta would be
+# more than half the size of the timetable. delta_chain lists the versions
+# from the last snapshot up to a version, so one select rebuilds any of them.
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "10"))
+SCHEDULE_ROW_FIELDS = ("course_id", "professor_id", "classroom_id", "day", "start_time", "end_time")
+
+
+def row_key(row):
+    return (row['course_id'], row['professor_id'], row['classroom_id'], row['day'],
+            time_to_minutes(row['start_time']), time_to_minutes(row['end_time']))
+
+
+def version_chain(version):
+    # Versions written before deltas existed are full snapshots
+    return version.get("delta_chain") or [version["id"]]
+
+
+def diff_rows(previous_rows, rows):
+    # Multiset difference by placement: (rows to add, rows to remove)
+    remaining = {}
+    for row in previous_rows:
+        remaining.setdefault(row_key(row), []).append(row)
+    added = []
+    for row in rows:
+        matches = remaining.get(row_key(row))
+        if matches:
+            matches.pop()
+        else:
+            added.append(row)
+    return added, [row for matches in remaining.values() for row in matches]
+
+
+def apply_delta_chain(chain, rows):
+    # rows: the schedule_rows of every version in chain, in any order
+    by_version = {}
+    for row in rows:
+        by_version.setdefault(row['timetable_version_id'], []).append(row)
+    placed = {}
+    for version_id in chain:
+        version_rows = by_version.get(version_id, ())
+        for row in version_rows:
+            if row.get('removed'):
+                placed[row_key(row)].pop()
+        for row in version_rows:
+            if not row.get('removed'):
+                placed.setdefault(row_key(row), []).append({k: row[k] for k in SCHEDULE_ROW_FIELDS})
+    return [row for rows in placed.values() for row in rows]
+
+
+def entries_digest(entries):
+    # Order-insensitive, so a user whose rows only came back in another order is unchanged
+    return hashlib.sha256(json.dumps(sorted(row_key(row) for row in entries)).encode()).hexdigest()
+
+
+def combined_digest(digests):
+    # A student's digest, built from the digests of their courses' rows
+    return hashlib.sha256(" ".join(sorted(digests)).encode()).hexdigest()
+
+
+def persist_schedule(
+    schedule, job_id, term='Fall 2025', data=None, solver=None, solver_params=None, changes=None,
+    fingerprint=None, cloned_from=None,
+):
+    rows = [{k: row[k] for k in SCHEDULE_ROW_FIELDS} for row in convert_to_serializable(schedule)]
+
+    base_resp = supabase.table("timetable_versions").select("*").eq("term", term).eq("status", "completed")\
+        .order("generated_at", desc=True).limit(1).execute()
+    base = base_resp.data[0] if base_resp.data else None
+    base_chain = version_chain(base) if base else []
+    base_rows = load_schedule_rows(base["id"]) if base else []
+    added, removed = diff_rows(base_rows, rows)
+    snapshot = base is None or len(base_chain) >= SNAPSHOT_INTERVAL or len(added) + len(removed) > len(rows) // 2
+
+    # The version stays "persisting" until every row is written, so readers never see half a timetable
     version_resp = supabase.table("timetable_versions").insert({
         "term": term,
         "generated_at": datetime.utcnow().isoformat(),
         "job_id": job_id,
+        "status": "persisting",
+        "solver": solver,
+        "solver_params": solver_params,
+        "input_fingerprint": fingerprint,
+        "base_version_id": None if snapshot else base["id"],
     }).execute()
 
     if not version_resp.data:
         raise Exception("Failed to create timetable version")
 
     version_id = version_resp.data[0]["id"]
+    delta_chain = [version_id] if snapshot else base_chain + [version_id]
+    stats = {"snapshot": snapshot}
+    if base is not None:
+        stats["changes"] = changes if changes is not None else schedule_changes(base_rows, rows)
+    if cloned_from is not None:
+        stats["cloned_from"] = cloned_from
 
-    supabase.table("schedule_rows").delete().eq("timetable_version_id", version_id).execute()
-
-    bulk_data = []
-    for row in serializable_schedule:
-        bulk_data.append({
-            "timetable_version_id": version_id,
-            "course_id": row["course_id"],
-            "professor_id": row["professor_id"],
-            "classroom_id": row["classroom_id"],
-            "day": row["day"],
-            "start_time": row["start_time"],
-            "end_time": row["end_time"],
-        })
-
-    insert_resp = supabase.table("schedule_rows").insert(bulk_data).execute()
-    if not insert_resp.data:
-        raise Exception("Failed to insert schedule rows")
-
-    professor_entries = {}
-    for entry in bulk_data:
-        prof = entry["professor_id"]
-        if prof not in professor_entries:
-            professor_entries[prof] = []
-        professor_entries[prof].append(entry)
-
-    enrollments = supabase.table("enrollments").select("*").execute().data
-    student_courses = {}
-    for e in enrollments:
-        student_courses.setdefault(e["student_id"], []).append(e["course_id"])
-
-    student_entries = {}
-    for student_id, courses in student_courses.items():
-        entries = [e for e in bulk_data if e["course_id"] in courses]
-        if entries:
-            student_entries[student_id] = entries
-
-    for prof_id, entries in professor_entries.items():
-        supabase.table("timetable_entries").insert({
-            "user_id": prof_id,
-            "role": "professor",
-            "timetable_version_id": version_id,
-            "timetable": entries,
-        }).execute()
+    try:
+        bulk_data = [{"timetable_version_id": version_id, **row} for row in rows]
+        if snapshot:
+            stats["schedule_rows"] = write_rows("schedule_rows", bulk_data)
+        else:
+            stats["schedule_rows"] = write_rows("schedule_rows", [
+                {"timetable_version_id": version_id, **row} for row in added
+            ] + [
+                {"timetable_version_id": version_id, **{k: row[k] for k in SCHEDULE_ROW_FIELDS}, "removed": True}
+                for row in removed
+            ])
+
+        professor_entries = {}
+        for entry in bulk_data:
+            prof = entry["professor_id"]
+            if prof not in professor_entries:
+                professor_entries[prof] = []
+            professor_entries[prof].append(entry)
+
+        # Per-user entries only list course ids, which /user-timetable hydrates
+        # from the version's rows; students with the same course set share one
+        if data is None:
+            data = fetch_all_data(("enrollments",))
+        course_rows = {}
+        for entry in bulk_data:
+            course_rows.setdefault(entry["course_id"], []).append(entry)
+
+        # Every user's entries are digested so they can be compared with the
+        # newest digests along the base's chain
+        timetables = {
+            ("professor", prof_id): (sorted({row["course_id"] for row in entries}), entries_digest(entries))
+            for prof_id, entries in professor_entries.items()
+        }
+        course_digests = {course: entries_digest(entries) for course, entries in course_rows.items()}
+        timetables_by_course_set = {}
+        for student_id, courses in data["enrollment_index"]["student_courses"].items():
+            timetable = timetables_by_course_set.get(courses)
+            if timetable is None:
+                scheduled = sorted(course for course in courses if course in course_rows)
+                timetable = (scheduled, combined_digest(course_digests[course] for course in scheduled))
+                timetables_by_course_set[courses] = timetable
+            if timetable[0]:
+                timetables[("student", student_id)] = timetable
+
+        previous = {}
+        if base is not None:
+            base_entries = supabase.table("timetable_entries").select("user_id, role, digest, timetable_version_id")\
+                .in_("timetable_version_id", base_chain).execute().data
+            for entry in sorted(base_entries, key=itemgetter("timetable_version_id")):
+                previous[(entry["role"], entry["user_id"])] = entry["digest"]
+        empty = entries_digest([])
+        # Users whose timetable emptied get an empty entry so older ones along the chain stop applying
+        dropped = {user: ([], empty) for user, digest in previous.items() if digest != empty and user not in timetables}
+        changed = {
+            user: timetable for user, timetable in chain(timetables.items(), dropped.items())
+            if previous.get(user) != timetable[1]
+        }
 
-    for student_id, entries in student_entries.items():
-        supabase.table("timetable_entries").insert({
-            "user_id": student_id,
-            "role": "student",
+        written = timetables if snapshot else changed
+        stats["timetable_entries"] = write_rows("timetable_entries", [
+            {"user_id": user_id, "role": role, "timetable_version_id": version_id, "course_ids": course_ids, "digest": digest}
+            for (role, user_id), (course_ids, digest) in written.items()
+        ])
+
+        notified_users = {user_id for _, user_id in changed}
+        stats["notifications"] = write_rows("notifications", [
+            {"user_id": user_id, "message": f"Your timetable for {term} has been updated."}
+            for user_id in notified_users
+        ])
+    except Exception as e:
+        supabase.table("timetable_versions").update({"status": "incomplete"}).eq("id", version_id).execute()
+        supabase.table("generation_jobs").insert({
+            "job_id": job_id,
+            "job_status": "incomplete",
             "timetable_version_id": version_id,
-            "timetable": entries,
-        }).execute()
-
-    notified_users = set(professor_entries.keys()) | set(student_entries.keys())
-    for user_id in notified_users:
-        supabase.table("notifications").insert({
-            "user_id": user_id,
-            "message": f"Your timetable for {term} has been updated.",
+            "stats": stats,
+            "error": str(e),
         }).execute()
+        raise
 
+    supabase.table("timetable_versions").update({"status": "completed", "delta_chain": delta_chain}).eq("id", version_id).execute()
     supabase.table("generation_jobs").insert({
         "job_id": job_id,
         "job_status": "completed",
         "timetable_version_id": version_id,
+        "stats": stats,
     }).execute()
-
+    store_version_rows(version_id, rows)
+    note_new_version(version_id, delta_chain)
     return version_id
 
 
-@app.post("/generate-timetable")
-async def generate_timetable(term: str = Query("Fall 2025"), force_regenerate: bool = Query(False)):
-    # Check if timetable for term already exists
-    existing_versions = supabase.table("timetable_versions").select("*").eq("term", term).order("generated_at", desc=True).limit(1).execute()
-    if existing_versions.data and not force_regenerate:
-        version = existing_versions.data[0]
-        version_id = version["id"]
-        job_id = version["job_id"]
-        # Fetch transformed schedule from schedule_rows
-        schedule_rows = supabase.table("schedule_rows").select("*").eq("timetable_version_id", version_id).execute().data
-        ref_data = fetch_all_data()
-        transformed_schedule = transform_schedule(schedule_rows, ref_data)
+# Versions never change once written, so their rendered view is cached per
+# version (and per lookup-table digest, since an upload can rename things)
+RENDERED_VERSION_CACHE_SIZE = int(os.getenv("RENDERED_VERSION_CACHE_SIZE", "16"))
+rendered_versions = OrderedDict()
+rendered_versions_lock = threading.Lock()
+
+
+def store_rendered_version(version_id, data, transformed_schedule):
+    key = (version_id, lookup_digest(data))
+    with rendered_versions_lock:
+        rendered_versions[key] = transformed_schedule
+        rendered_versions.move_to_end(key)
+        while len(rendered_versions) > RENDERED_VERSION_CACHE_SIZE:
+            rendered_versions.popitem(last=False)
+
+
+# Rebuilt versions are kept whole; a chain can be up to SNAPSHOT_INTERVAL deltas long
+VERSION_ROWS_CACHE_SIZE = int(os.getenv("VERSION_ROWS_CACHE_SIZE", "8"))
+version_rows = OrderedDict()
+version_indexes = OrderedDict()
+version_rows_lock = threading.Lock()
+
+
+def store_version_rows(version_id, rows):
+    with version_rows_lock:
+        version_rows[version_id] = rows
+        version_rows.move_to_end(version_id)
+        while len(version_rows) > VERSION_ROWS_CACHE_SIZE:
+            version_rows.popitem(last=False)
+    return rows
+
+
+def cached_version_rows(version_id):
+    with version_rows_lock:
+        rows = version_rows.get(version_id)
+        if rows is not None:
+            version_rows.move_to_end(version_id)
+        return rows
+
+
+def load_schedule_rows(version_id):
+    # Full rows of a version, replayed from its last snapshot
+    rows = cached_version_rows(version_id)
+    if rows is not None:
+        return rows
+    version = supabase.table("timetable_versions").select("*").eq("id", version_id).execute().data
+    chain = version_chain(version[0]) if version else [version_id]
+    rows = supabase.table("schedule_rows").select("*").in_("timetable_version_id", chain).execute().data
+    return store_version_rows(version_id, apply_delta_chain(chain, rows))
+
+
+def version_course_index(rows):
+    by_course = {}
+    for row in rows:
+        by_course.setdefault(row["course_id"], []).append(row)
+    return by_course
+
+
+async def version_course_rows(version_id):
+    # course_id -> rows of a version, what per-user entries are hydrated from
+    with version_rows_lock:
+        by_course = version_indexes.get(version_id)
+        if by_course is not None:
+            version_indexes.move_to_end(version_id)
+            return by_course
+    by_course = await run_in_threadpool(version_course_index, await load_schedule_rows_async(version_id))
+    with version_rows_lock:
+        version_indexes[version_id] = by_course
+        while len(version_indexes) > VERSION_ROWS_CACHE_SIZE:
+            version_indexes.popitem(last=False)
+    return by_course
+
+
+async def load_schedule_rows_async(version_id):
+    rows = cached_version_rows(version_id)
+    if rows is not None:
+        return rows
+    version = (await (await get_db()).table("timetable_versions").select("*").eq("id", version_id).execute()).data
+    chain = version_chain(version[0]) if version else [version_id]
+    rows = await select_in("schedule_rows", "timetable_version_id", chain)
+    return store_version_rows(version_id, await run_in_threadpool(apply_delta_chain, chain, rows))
+
+
+async def render_version(version_id):
+    ref_data = await fetch_all_data_async(LOOKUP_TABLES)
+    key = (version_id, lookup_digest(ref_data))
+    with rendered_versions_lock:
+        if key in rendered_versions:
+            rendered_versions.move_to_end(key)
+            return rendered_versions[key]
+
+    # Fetch transformed schedule from schedule_rows
+    schedule_rows = await load_schedule_rows_async(version_id)
+    transformed_schedule = await run_in_threadpool(transform_schedule, schedule_rows, ref_data)
+    store_rendered_version(version_id, ref_data, transformed_schedule)
+    return transformed_schedule
+
+
+# Job state is shared by every uvicorn worker through a SQLite file in WAL
+# mode: readers never wait on the writer, so polling GET /job/{id} stays
+# cheap. Status and phase are columns so transitions can be made atomically;
+# everything else a job reports lives in its JSON data. A term's generation
+# holds a lease in job_leases while queued or running. The owning process
+# renews it every JOB_LEASE_TTL / 3 seconds, so a second submission for the
+# term finds the running job instead of starting another, and a job whose
+# process died is marked failed once its lease runs out.
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db"))
+JOB_LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", "30"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "86400"))
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.connection().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                term TEXT NOT NULL,
+                status TEXT NOT NULL,
+                phase TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                stop_requested INTEGER NOT NULL DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                event TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq);
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (job_id, key)
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_leases (
+                term TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+
+    def connection(self):
+        # sqlite3 connections cannot be shared between threads
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so a read followed
+        # by a write inside one transaction cannot race another process
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def create(self, job, owner, lease_key=None):
+        # Returns (job_id, True) for a new job, or the term's active job and
+        # False when another one already holds the lease. The lease is taken
+        # on lease_key instead of the term when one is given.
+        lease_key = lease_key or job["term"]
+        now = wall_clock()
+        with self.transaction() as db:
+            lease = db.execute("SELECT * FROM job_leases WHERE term = ?", (lease_key,)).fetchone()
+            if lease is not None:
+                if lease["expires_at"] > now:
+                    return lease["job_id"], False
+                self._fail_lost(db, lease["job_id"], now)
+            expired = [row["job_id"] for row in db.execute(
+                "SELECT job_id FROM jobs WHERE finished_at < ?", (now - JOB_RETENTION,)
+            )]
+            db.executemany("DELETE FROM job_events WHERE job_id = ?", [(job_id,) for job_id in expired])
+            db.executemany("DELETE FROM job_results WHERE job_id = ?", [(job_id,) for job_id in expired])
+            db.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in expired])
+
+            fields = {k: v for k, v in job.items() if k not in ("job_id", "term", "status", "phase")}
+            db.execute(
+                "INSERT INTO jobs (job_id, term, status, phase, data) VALUES (?, ?, 'queued', NULL, ?)",
+                (job["job_id"], job["term"], json.dumps(fields, default=str)),
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO job_leases (term, job_id, owner, expires_at) VALUES (?, ?, ?, ?)",
+                (lease_key, job["job_id"], owner, now + JOB_LEASE_TTL),
+            )
+        return job["job_id"], True
+
+    def get(self, job_id):
+        row = self.connection().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row["status"] in ACTIVE_JOB_STATUSES and not self._lease_alive(self.connection(), job_id, wall_clock()):
+            # Its worker died and nobody has reaped it yet; recheck under the write lock
+            # in case the owner renewed in between
+            with self.transaction() as db:
+                now = wall_clock()
+                if not self._lease_alive(db, job_id, now):
+                    self._fail_lost(db, job_id, now)
+                row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        job = {"job_id": row["job_id"], "term": row["term"], "status": row["status"], "phase": row["phase"]}
+        job.update(json.loads(row["data"]))
+        if row["started_at"] is not None:
+            job["elapsed_seconds"] = round((row["finished_at"] or wall_clock()) - row["started_at"], 3)
+        return job
+
+    def update(self, job_id, event=None, **fields):
+        # Merges fields into the job and optionally appends a progress event;
+        # returns the (cancel_requested, stop_requested) flags
+        with self.transaction() as db:
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            columns = {k: fields.pop(k) for k in ("status", "phase", "started_at", "finished_at") if k in fields}
+            data = json.loads(row["data"])
+            data.update(fields)
+            columns["data"] = json.dumps(data, default=str)
+            db.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in columns)} WHERE job_id = ?",
+                (*columns.values(), job_id),
+            )
+            if event is not None:
+                db.execute("INSERT INTO job_events (job_id, event) VALUES (?, ?)", (job_id, json.dumps(event)))
+        return bool(row["cancel_requested"]), bool(row["stop_requested"])
+
+    def start(self, job_id):
+        # queued -> running; False if the job was cancelled before it started
+        with self.transaction() as db:
+            started = db.execute(
+                "UPDATE jobs SET status = 'running', phase = 'fetching', started_at = ? WHERE job_id = ? AND status = 'queued'",
+                (wall_clock(), job_id),
+            ).rowcount
+        return bool(started)
+
+    def begin_persisting(self, job_id):
+        # Past this point the job can no longer be cancelled
+        with self.transaction() as db:
+            moved = db.execute(
+                "UPDATE jobs SET phase = 'persisting' WHERE job_id = ? AND cancel_requested = 0", (job_id,)
+            ).rowcount
+        return bool(moved)
+
+    def request(self, job_id, flag):
+        # Sets cancel_requested or stop_requested. A queued job is cancelled on
+        # the spot; returns None for unknown jobs and False if it is too late
+        with self.transaction() as db:
+            row = db.execute("SELECT status, phase, term FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] not in ACTIVE_JOB_STATUSES or row["phase"] == "persisting":
+                return False
+            db.execute(f"UPDATE jobs SET {flag} = 1 WHERE job_id = ?", (job_id,))
+            if flag == "cancel_requested" and row["status"] == "queued":
+                db.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ?", (wall_clock(), job_id)
+                )
+                db.execute("DELETE FROM job_leases WHERE job_id = ?", (job_id,))
+        return True
+
+    def finish(self, job_id, **fields):
+        self.update(job_id, finished_at=wall_clock(), **fields)
+        with self.transaction() as db:
+            db.execute("DELETE FROM job_leases WHERE job_id = ?", (job_id,))
+
+    def events(self, job_id, after=0):
+        return [
+            (row["seq"], json.loads(row["event"]))
+            for row in self.connection().execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            )
+        ]
+
+    def put_result(self, job_id, key, result):
+        # Bulky per-job output kept out of the job's own data
+        with self.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO job_results (job_id, key, result) VALUES (?, ?, ?)",
+                (job_id, key, json.dumps(result, default=str)),
+            )
+
+    def get_result(self, job_id, key):
+        row = self.connection().execute(
+            "SELECT result FROM job_results WHERE job_id = ? AND key = ?", (job_id, key)
+        ).fetchone()
+        return json.loads(row["result"]) if row is not None else None
+
+    def claim_scenario(self, job_id, index, owner):
+        # Takes the right to persist one scenario of a batch as a lease, so a
+        # claim held by a process that died runs out like any other lease.
+        # Returns ("persisted", version_id), ("claimed", None) or ("busy", None).
+        key = f"scenario:{job_id}:{index}"
+        now = wall_clock()
+        with self.transaction() as db:
+            row = db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            version_id = json.loads(row["data"])["scenarios"][index].get("timetable_version_id")
+            if version_id is not None:
+                return "persisted", version_id
+            lease = db.execute("SELECT expires_at FROM job_leases WHERE term = ?", (key,)).fetchone()
+            if lease is not None and lease["expires_at"] > now:
+                return "busy", None
+            # The lease is its own job_id, so reaping it never touches the batch's other leases
+            db.execute(
+                "INSERT OR REPLACE INTO job_leases (term, job_id, owner, expires_at) VALUES (?, ?, ?, ?)",
+                (key, key, owner, now + JOB_LEASE_TTL),
+            )
+        return "claimed", None
+
+    def release_scenario(self, job_id, index, version_id=None):
+        # Records the persisted version on that scenario alone, then drops the claim
+        key = f"scenario:{job_id}:{index}"
+        with self.transaction() as db:
+            if version_id is not None:
+                row = db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                data = json.loads(row["data"])
+                data["scenarios"][index]["timetable_version_id"] = version_id
+                db.execute("UPDATE jobs SET data = ? WHERE job_id = ?", (json.dumps(data, default=str), job_id))
+            db.execute("DELETE FROM job_leases WHERE term = ?", (key,))
+
+    def counter(self, name):
+        # Values every worker shares besides jobs, such as the reference data generation
+        row = self.connection().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row["value"] if row is not None else 0
+
+    def bump(self, name):
+        with self.transaction() as db:
+            db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+
+    def renew_leases(self, owner):
+        now = wall_clock()
+        with self.transaction() as db:
+            db.execute("UPDATE job_leases SET expires_at = ? WHERE owner = ?", (now + JOB_LEASE_TTL, owner))
+            lost = [row["job_id"] for row in db.execute("SELECT job_id FROM job_leases WHERE expires_at <= ?", (now,))]
+            for job_id in lost:
+                self._fail_lost(db, job_id, now)
+
+    def _lease_alive(self, db, job_id, now):
+        # Queued and running jobs always hold a lease, created with the job
+        lease = db.execute("SELECT expires_at FROM job_leases WHERE job_id = ?", (job_id,)).fetchone()
+        return lease is not None and lease["expires_at"] > now
+
+    def _fail_lost(self, db, job_id, now):
+        row = db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        db.execute("DELETE FROM job_leases WHERE job_id = ?", (job_id,))
+        if row is None:
+            return
+        data = json.loads(row["data"])
+        data["error"] = "The worker running this job stopped before it finished"
+        db.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, data = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+            (now, json.dumps(data, default=str), job_id),
+        )
+
+
+job_store = JobStore(JOB_STORE_PATH)
+# Identifies this process as a lease holder; the pid alone can be reused
+job_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+lease_heartbeat = {"thread": None}
+lease_heartbeat_lock = threading.Lock()
+
+
+def renew_job_leases():
+    while True:
+        sleep(JOB_LEASE_TTL / 3)
+        try:
+            job_store.renew_leases(job_owner)
+        except sqlite3.Error:
+            # Try again on the next beat; the lease outlives two missed renewals
+            pass
+
+
+def start_lease_heartbeat():
+    with lease_heartbeat_lock:
+        if lease_heartbeat["thread"] is None:
+            lease_heartbeat["thread"] = threading.Thread(target=renew_job_leases, daemon=True)
+            lease_heartbeat["thread"].start()
 
-        return {
-            "job_id": job_id,
-            "status": "cached",
-            "timetable_version_id": version_id,
-            "term": term,
-            "generated_at": version["generated_at"],
-            **transformed_schedule
-        }
 
-    # Otherwise generate new timetable and persist
+class JobCancelled(Exception):
+    pass
+
+
+def update_job(job_id, **fields):
+    return job_store.update(job_id, **fields)
+
+
+def job_view(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def run_generation_job(job_id, term, solver, solver_params, clone_of=None):
+    # clone_of is a completed version the endpoint found with this request's
+    # fingerprint; it is copied instead of solving if the inputs still match
+    if not job_store.start(job_id):
+        # Cancelled while it was still queued
+        return
+    started = wall_clock()
+    stopped = False
     try:
-        data = fetch_all_data()
-        schedule = run_genetic_algorithm(data)
-        job_id = str(uuid.uuid4())
-        jobs[job_id] = "running"
+        data = fetch_all_data(fresh=True)
+        fingerprint = input_fingerprint(data, solver, solver_params)
+        if clone_of is not None and clone_of["input_fingerprint"] == fingerprint:
+            update_job(job_id, phase="cloning", cloned_from=clone_of["id"])
+            cloned = load_schedule_rows(clone_of["id"])
+            if not job_store.begin_persisting(job_id):
+                raise JobCancelled()
+            version_id = persist_schedule(
+                cloned, job_id, term, data, solver, clone_of["solver_params"], fingerprint=fingerprint,
+                cloned_from=clone_of["id"],
+            )
+            store_rendered_version(version_id, data, convert_to_serializable(transform_schedule(cloned, data)))
+            job_store.finish(job_id, status="completed", phase="done", timetable_version_id=version_id)
+            return
+        if solver == "repair":
+            data["previous_schedule"] = load_schedule_rows(solver_params["previous_version_id"])
+
+        def progress(generation, best_fitness, stats):
+            nonlocal stopped
+            cancel, stop = update_job(
+                job_id,
+                event={
+                    "generation": generation,
+                    "best_fitness": float(best_fitness),
+                    **stats,
+                    "elapsed_seconds": round(wall_clock() - started, 3),
+                },
+                generation=generation,
+                best_fitness=float(best_fitness),
+                **stats,
+            )
+            if cancel:
+                raise JobCancelled()
+            stopped = stopped or stop
+            return stop
+
+        cancel, _ = update_job(job_id, phase="evolving")
+        if cancel:
+            raise JobCancelled()
+        solve_started = monotonic()
+        schedule = SOLVERS[solver](data, progress=progress, **solver_params)
+        reproducible = not stopped and reproducible_run(solver, solver_params, monotonic() - solve_started)
+        changes = None
+        if solver == "repair":
+            changes = schedule_changes(data["previous_schedule"], schedule)
+            update_job(job_id, changes=changes)
+
+        if not job_store.begin_persisting(job_id):
+            raise JobCancelled()
+        # A run cut short by a stop request or the clock is not what a rerun would produce
+        version_id = persist_schedule(
+            schedule, job_id, term, data, solver, solver_params, changes, fingerprint if reproducible else None
+        )
+        store_rendered_version(version_id, data, convert_to_serializable(transform_schedule(schedule, data)))
+        job_store.finish(job_id, status="completed", phase="done", timetable_version_id=version_id)
+    except JobCancelled:
+        job_store.finish(job_id, status="cancelled")
+    except Exception as e:
+        job_store.finish(job_id, status="failed", error=str(e))
 
-        version_id = persist_schedule(schedule, job_id, term)
-        jobs[job_id] = "completed"
 
-        transformed_schedule = transform_schedule(schedule, data)
-        serializable_schedule = convert_to_serializable(transformed_schedule)
+def submit_generation_job(term, solver, solver_params, clone_of=None):
+    # Returns the term's already queued or running job instead of starting
+    # a second generation for it
+    job_id, created = job_store.create({
+        "job_id": str(uuid.uuid4()),
+        "term": term,
+        "solver": solver,
+        # Iterations for the annealer, generations for the GA
+        "generation": 0,
+        "generations": solver_params.get("generations", 100 if solver == "genetic" else None),
+        "best_fitness": None,
+        "submitted_at": datetime.utcnow().isoformat(),
+    }, job_owner)
+    if created:
+        start_lease_heartbeat()
+        job_executor.submit(run_generation_job, job_id, term, solver, solver_params, clone_of)
+    return job_id
 
-        return {
-            "job_id": job_id,
-            "status": "completed",
-            "timetable_version_id": version_id,
-            "term": term,
-            "generated_at": datetime.utcnow().isoformat(),
-            **serializable_schedule
+
+@app.post("/generate-timetable")
+async def generate_timetable(
+    term: str = Query("Fall 2025"),
+    force_regenerate: bool = Query(False),
+    workers: int = Query(1, ge=1, le=os.cpu_count() or 1),
+    islands: int = Query(1, ge=1),
+    migration_interval: int = Query(10, ge=1),
+    initializer: str = Query("random", pattern="^(random|constructive)$"),
+    solver: str = Query("genetic", pattern="^(genetic|annealing|repair)$"),
+    time_budget: float = Query(None, gt=0),
+    generations: int = Query(100, ge=1),
+    stagnation: int = Query(None, ge=1),
+    iterations: int = Query(None, ge=1),
+    seed: int = Query(None, ge=0),
+):
+    # Check if timetable for term already exists
+    db = await get_db()
+    existing_versions = await db.table("timetable_versions").select("*").eq("term", term).eq("status", "completed").order("generated_at", desc=True).limit(1).execute()
+    if existing_versions.data and not force_regenerate:
+        return await cached_version(existing_versions.data[0], term)
+
+    # Otherwise queue a generation job and return straight away
+    if solver == "genetic":
+        solver_params = {
+            "generations": generations,
+            "workers": workers,
+            "islands": islands,
+            "migration_interval": migration_interval,
+            "initializer": initializer,
+            "time_budget": time_budget,
+            "stagnation": stagnation,
         }
+    elif solver == "annealing":
+        # Without an iteration cap the annealer gets a minute
+        if iterations is None:
+            time_budget = time_budget or 60
+        solver_params = {"initializer": initializer, "time_budget": time_budget, "max_iterations": iterations}
+    else:
+        # Repair starts from the term's latest completed version
+        if not existing_versions.data:
+            raise HTTPException(status_code=404, detail=f"No timetable to repair for {term}")
+        solver_params = {"previous_version_id": existing_versions.data[0]["id"], "time_budget": time_budget}
+
+    # The same inputs were solved before: if that version is the term's current
+    # one return it, otherwise the job copies it rather than solving again
+    fingerprint = input_fingerprint(await fetch_all_data_async(fresh=True), solver, solver_params)
+    matches = await db.table("timetable_versions").select("*").eq("input_fingerprint", fingerprint).eq("status", "completed").order("generated_at", desc=True).execute()
+    match = fingerprint_match(matches.data, seed)
+    if match is not None and existing_versions.data and match["id"] == existing_versions.data[0]["id"]:
+        return await cached_version(match, term)
+
+    # Unseeded runs draw a seed so every version can be reproduced later
+    solver_params["seed"] = seed if seed is not None else random.randrange(2**32)
+    job_id = submit_generation_job(term, solver, solver_params, match)
+    return job_view(job_id)
+
+
+# Scenario batches solve several what-if variants of the reference data side
+# by side without persisting anything; the admin then persists the one they
+# pick with POST /job/{job_id}/scenarios/{index}/persist
+SCENARIO_WORKERS = int(os.getenv("SCENARIO_WORKERS", str(os.cpu_count() or 1)))
+
+
+class Scenario(BaseModel):
+    name: str = None
+    term: str = "Fall 2025"
+    solver: str = Field("genetic", pattern="^(genetic|annealing)$")
+    population_size: int = Field(50, ge=2)
+    generations: int = Field(100, ge=1)
+    islands: int = Field(1, ge=1)
+    migration_interval: int = Field(10, ge=1)
+    initializer: str = Field("random", pattern="^(random|constructive)$")
+    time_budget: float = Field(None, gt=0)
+    stagnation: int = Field(None, ge=1)
+    iterations: int = Field(None, ge=1)
+    seed: int = Field(None, ge=0)
+    # Data overrides per reference table: ids of rows to leave out (a closed
+    # building's classrooms) and rows to add (an extra Saturday slot set)
+    exclude: dict[str, list] = {}
+    add: dict[str, list[dict]] = {}
+
+
+class ScenarioBatch(BaseModel):
+    scenarios: list[Scenario] = Field(min_length=1)
+
+
+def scenario_solver_params(scenario):
+    # Scenarios run one per process, so the GA itself stays single-process
+    if scenario.solver == "genetic":
+        params = {
+            "population_size": scenario.population_size,
+            "generations": scenario.generations,
+            "islands": scenario.islands,
+            "migration_interval": scenario.migration_interval,
+            "initializer": scenario.initializer,
+            "time_budget": scenario.time_budget,
+            "stagnation": scenario.stagnation,
+        }
+    else:
+        params = {
+            "initializer": scenario.initializer,
+            "time_budget": scenario.time_budget or (None if scenario.iterations else 60),
+            "max_iterations": scenario.iterations,
+        }
+    params["seed"] = scenario.seed if scenario.seed is not None else random.randrange(2**32)
+    return params
+
+
+def apply_overrides(data, exclude, add):
+    # Copy of the fetch_all_data() snapshot with the scenario's rows left out
+    # or added; derived indexes and digests are rebuilt for the tables touched
+    scenario_data = dict(data)
+    for name in set(exclude) | set(add):
+        if name not in REFERENCE_TABLES:
+            raise HTTPException(status_code=422, detail=f"Unknown table '{name}' in scenario overrides")
+        excluded = {str(row_id) for row_id in exclude.get(name, [])}
+        rows = [row for row in data[name] if str(row.get("id")) not in excluded] + add.get(name, [])
+        try:
+            scenario_data.update(reference_part(name, rows))
+        except KeyError as e:
+            raise HTTPException(status_code=422, detail=f"Rows added to '{name}' are missing the {e} column")
+    return scenario_data
+
+
+def run_scenario_job(job_id, runs):
+    # runs: (data, solver, solver_params) per scenario, in request order
+    if not job_store.start(job_id):
+        return
+    results = [None] * len(runs)
+    try:
+        update_job(job_id, phase="solving")
+        pool = ProcessPoolExecutor(
+            max_workers=min(len(runs), SCENARIO_WORKERS), mp_context=multiprocessing.get_context("spawn")
+        )
+        with pool:
+            futures = {pool.submit(run_scenario, *run): i for i, run in enumerate(runs)}
+            for done, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    schedule, results[i] = future.result()
+                    job_store.put_result(job_id, str(i), schedule)
+                except Exception as e:
+                    results[i] = {"error": str(e)}
+                cancel, _ = update_job(job_id, event={"scenario": i, **results[i]}, completed=done)
+                if cancel:
+                    # Scenarios already running are left to finish
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise JobCancelled()
+        job_store.finish(job_id, status="completed", phase="done", results=results)
+    except JobCancelled:
+        job_store.finish(job_id, status="cancelled", results=results)
     except Exception as e:
-        job_id = str(uuid.uuid4())
-        jobs[job_id] = "failed"
-        return {"job_id": job_id, "status": "failed", "error": str(e)}
+        job_store.finish(job_id, status="failed", error=str(e))
+
+
+@app.post("/generate-scenarios")
+async def generate_scenarios(batch: ScenarioBatch):
+    # The reference data is fetched once and shared by every scenario
+    data = await fetch_all_data_async(fresh=True)
+    runs = []
+    scenarios = []
+    for i, scenario in enumerate(batch.scenarios):
+        scenario_data = await run_in_threadpool(apply_overrides, data, scenario.exclude, scenario.add)
+        solver_params = scenario_solver_params(scenario)
+        runs.append((scenario_data, scenario.solver, solver_params))
+        scenarios.append({
+            "name": scenario.name or f"Scenario {i + 1}",
+            "term": scenario.term,
+            "solver": scenario.solver,
+            "solver_params": solver_params,
+            "exclude": scenario.exclude,
+            "add": scenario.add,
+            "input_fingerprint": input_fingerprint(scenario_data, scenario.solver, solver_params),
+        })
+
+    job_id = str(uuid.uuid4())
+    job_store.create({
+        "job_id": job_id,
+        "term": ", ".join(dict.fromkeys(s["term"] for s in scenarios)),
+        "kind": "scenarios",
+        "scenarios": scenarios,
+        "completed": 0,
+        "submitted_at": datetime.utcnow().isoformat(),
+    }, job_owner, lease_key=f"scenarios:{job_id}")
+    start_lease_heartbeat()
+    job_executor.submit(run_scenario_job, job_id, runs)
+    return job_view(job_id)
+
+
+@app.post("/job/{job_id}/scenarios/{index}/persist")
+async def persist_scenario(job_id: str, index: int):
+    job = job_view(job_id)
+    if job.get("kind") != "scenarios":
+        raise HTTPException(status_code=404, detail="Job is not a scenario batch")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Scenario batch is {job['status']}")
+    if not 0 <= index < len(job["scenarios"]):
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    # Concurrent requests for one scenario persist it once; the others get its
+    # version or a 409 while it is being written
+    claim, version_id = job_store.claim_scenario(job_id, index, job_owner)
+    if claim == "persisted":
+        return {"job_id": job_id, "scenario": index, "timetable_version_id": version_id}
+    if claim == "busy":
+        raise HTTPException(status_code=409, detail="Scenario is already being persisted")
+    start_lease_heartbeat()
+    try:
+        schedule = job_store.get_result(job_id, str(index))
+        if schedule is None:
+            raise HTTPException(status_code=409, detail="Scenario did not produce a schedule")
+
+        # Students are fanned out from the current enrollments, with the scenario's overrides applied
+        scenario = job["scenarios"][index]
+        data = await run_in_threadpool(
+            apply_overrides, await fetch_all_data_async(), scenario["exclude"], scenario["add"]
+        )
+        reproducible = reproducible_run(scenario["solver"], scenario["solver_params"], job["results"][index]["seconds"])
+        version_id = await run_in_threadpool(
+            persist_schedule, schedule, job_id, scenario["term"], data, scenario["solver"], scenario["solver_params"],
+            fingerprint=scenario["input_fingerprint"] if reproducible else None,
+        )
+        store_rendered_version(version_id, data, convert_to_serializable(transform_schedule(schedule, data)))
+    finally:
+        job_store.release_scenario(job_id, index, version_id)
+    return {"job_id": job_id, "scenario": index, "timetable_version_id": version_id}
 
 
+async def cached_version(version, term):
+    return {
+        "job_id": version["job_id"],
+        "status": "cached",
+        "timetable_version_id": version["id"],
+        "term": term,
+        "generated_at": version["generated_at"],
+        **(await render_version(version["id"])),
+    }
+
 
 @app.get("/job/{job_id}")
 async def get_job_status(job_id: str):
-    status = jobs.get(job_id)
-    if status is None:
-        job_data = supabase.table("generation_jobs").select("*").eq("job_id", job_id).execute()
-        if job_data.data:
-            status = job_data.data[0]["job_status"]
-            jobs[job_id] = status
-        else:
-            raise HTTPException(status_code=404, detail="Job not found")
-    return {"job_id": job_id, "status": status}
+    job = job_store.get(job_id)
+    if job is not None:
+        return job
+    job_data = await (await get_db()).table("generation_jobs").select("*").eq("job_id", job_id).execute()
+    if not job_data.data:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job_id,
+        "status": job_data.data[0]["job_status"],
+        "timetable_version_id": job_data.data[0].get("timetable_version_id"),
+    }
+
+
+@app.post("/job/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    requested = job_store.request(job_id, "cancel_requested")
+    if requested is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not requested:
+        raise HTTPException(status_code=409, detail=f"Job is {job_view(job_id)['status']} and can no longer be cancelled")
+    return job_view(job_id)
+
+
+@app.post("/job/{job_id}/stop")
+async def stop_job(job_id: str):
+    # Unlike cancel, the best schedule found so far is still persisted
+    requested = job_store.request(job_id, "stop_requested")
+    if requested is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not requested:
+        raise HTTPException(status_code=409, detail=f"Job is {job_view(job_id)['status']} and can no longer be stopped")
+    return job_view(job_id)
+
+
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv("JOB_EVENTS_POLL_INTERVAL", "0.5"))
+
+
+@app.get("/job/{job_id}/events")
+async def job_events(job_id: str):
+    # Server-Sent Events: one "progress" event per solver report, then a
+    # final "done" event with the job as GET /job/{job_id} would return it
+    job_view(job_id)
+
+    async def stream():
+        sent = 0
+        while True:
+            # Read the status first so no report made before the job finished is missed
+            job = job_view(job_id)
+            finished = job["status"] not in ACTIVE_JOB_STATUSES
+            for sent, event in job_store.events(job_id, sent):
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            if finished:
+                yield f"event: done\ndata: {json.dumps(job, default=str)}\n\n"
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @app.get("/timetable")
 async def get_timetable(user_id: str, role: str, version_id: int = None):
     # For students, get courses they are enrolled in
+    db = await get_db()
     if role == "student":
-        enrollments = supabase.table("enrollments").select("course_id").eq("student_id", user_id).execute().data
-        enrolled_courses = list(set(e['course_id'] for e in enrollments)) if enrollments else []
+        enrollments = (await db.table("enrollments").select("course_id").eq("student_id", user_id).execute()).data
+        enrolled_courses = set(e['course_id'] for e in enrollments) if enrollments else set()
         if not enrolled_courses:
             return {"user_id": user_id, "role": role, "timetable": {}, "message": "No enrolled courses found"}
 
-        query = supabase.table("schedule_rows").select("*").in_("course_id", enrolled_courses)
-        if version_id:
-            query = query.eq("timetable_version_id", version_id)
-
-        schedule_data = query.execute().data or []
+        def keep(row):
+            return row['course_id'] in enrolled_courses
 
     # For teachers, get schedule rows assigned
     elif role == "professor" or role == "teacher":
-        query = supabase.table("schedule_rows").select("*").eq("professor_id", user_id)
-        if version_id:
-            query = query.eq("timetable_version_id", version_id)
-
-        schedule_data = query.execute().data or []
+        def keep(row):
+            return str(row['professor_id']) == user_id
 
     # For admin or others, optionally return full schedule or error
     else:
         return {"error": f"Role '{role}' not supported for timetable"}
 
+    # Versions are stored as deltas, so rows are filtered from the rebuilt version
+    if version_id is None:
+        version_id, _ = await get_latest_version()
+    schedule_data = [row for row in await load_schedule_rows_async(version_id) if keep(row)] if version_id else []
+
     # Fetch reference data to enhance the timetable display
-    ref_data = fetch_all_data()
+    ref_data = await fetch_all_data_async(LOOKUP_TABLES)
     transformed_schedule = transform_schedule(schedule_data, ref_data)
 
     return {
@@ -556,9 +2953,36 @@ async def get_timetable(user_id: str, role: str, version_id: int = None):
 
 
 
+@app.get("/reference-cache")
+async def get_reference_cache_stats():
+    generation = reference_generation()
+    with reference_cache_lock:
+        now = monotonic()
+        return {
+            "generation": generation,
+            "hits": reference_cache["hits"],
+            "misses": reference_cache["misses"],
+            "evictions": reference_cache["evictions"],
+            "cached_rows": reference_cache["rows"],
+            "max_rows": REFERENCE_CACHE_MAX_ROWS,
+            "ttl_seconds": REFERENCE_CACHE_TTL,
+            "tables": {
+                name: {"rows": entry["rows"], "age_seconds": round(now - entry["loaded_at"], 3)}
+                for name, entry in reference_cache["entries"].items()
+            },
+        }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/timetable-versions")
 async def get_timetable_versions():
-    versions = supabase.table("timetable_versions").select("*").order("generated_at", desc=True).execute()
+    versions = await (await get_db()).table("timetable_versions").select("*").order("generated_at", desc=True).execute()
     return {"versions": convert_to_serializable(versions.data)}
 
 
@@ -569,6 +2993,9 @@ def transform_schedule(schedule, data):
 
     output = {}
     total_classes = 0
+    # (day, start, end) -> time slot dict and (day, start, end, code) -> course dict
+    time_slot_index = {}
+    course_group_index = {}
 
     # Define day order for sorting
     day_order = {"Monday": 1, "Tuesday": 2, "Wednesday": 3,
@@ -590,24 +3017,19 @@ def transform_schedule(schedule, data):
             output[day] = []
 
         # Find or create time slot
-        time_slot_dict = next(
-            (ts for ts in output[day]
-             if ts['time_slot']['start_time'] == start_time
-             and ts['time_slot']['end_time'] == end_time),
-            None
-        )
+        slot_key = (day, start_time, end_time)
+        time_slot_dict = time_slot_index.get(slot_key)
         if time_slot_dict is None:
             time_slot_dict = {
                 'time_slot': {'start_time': start_time, 'end_time': end_time},
                 'courses': []
             }
             output[day].append(time_slot_dict)
+            time_slot_index[slot_key] = time_slot_dict
 
         # Find or create course entry
-        course_group = next(
-            (c for c in time_slot_dict['courses'] if c['course_code'] == course_code),
-            None
-        )
+        course_key = slot_key + (course_code,)
+        course_group = course_group_index.get(course_key)
         if course_group is None:
             course_group = {
                 'course_code': course_code,
@@ -615,6 +3037,7 @@ def transform_schedule(schedule, data):
                 'sections': []
             }
             time_slot_dict['courses'].append(course_group)
+            course_group_index[course_key] = course_group
 
         # Append classroom + professor info
         course_group['sections'].append({
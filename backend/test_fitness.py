@@ -0,0 +1,88 @@
+import random
+
+import numpy as np
+import pytest
+
+import benchmark
+import main
+
+
+# fitness() as it was before the interval sweep: every pair of entries is
+# compared, and every student is checked against every entry.
+def legacy_time_slots_conflict(slot1, slot2):
+    if slot1['day'] != slot2['day']:
+        return False
+    return max(slot1['start_time'], slot2['start_time']) < min(slot1['end_time'], slot2['end_time'])
+
+
+def legacy_fitness(schedule, data):
+    conflicts = 0
+
+    for i in range(len(schedule)):
+        for j in range(i + 1, len(schedule)):
+            a, b = schedule[i], schedule[j]
+            if a['professor_id'] == b['professor_id'] and legacy_time_slots_conflict(a, b):
+                conflicts += 50
+            if a['classroom_id'] == b['classroom_id'] and legacy_time_slots_conflict(a, b):
+                conflicts += 50
+
+    student_courses = {}
+    for e in data['enrollments']:
+        student_courses.setdefault(e['student_id'], []).append(e['course_id'])
+
+    for entry in schedule:
+        course = entry['course_id']
+        day = entry['day']
+        for student_id, courses in student_courses.items():
+            if course in courses:
+                occurrences = sum(1 for e in schedule if e['course_id'] == course and e['day'] == day)
+                if occurrences > 1:
+                    conflicts += 30 * (occurrences - 1)
+
+    prof_day_hours = {}
+    prof_week_hours = {}
+    for entry in schedule:
+        key = (entry['professor_id'], entry['day'])
+        prof_day_hours[key] = prof_day_hours.get(key, 0) + 1
+        prof_week_hours[entry['professor_id']] = prof_week_hours.get(entry['professor_id'], 0) + 1
+
+    for (prof, day), hours in prof_day_hours.items():
+        if hours > 5:
+            conflicts += (hours - 5) * 20
+
+    for prof, total_hours in prof_week_hours.items():
+        conflicts += abs(20 - total_hours) * 5
+
+    return conflicts
+
+
+@pytest.fixture(scope="module")
+def data():
+    return benchmark.synthetic_institution(courses=20, professors=4, classrooms=3, students=60, seed=1)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fitness_matches_pairwise_version(data, seed, monkeypatch):
+    # The old loop had no student clash term; everything else must agree exactly
+    monkeypatch.setattr(main, "STUDENT_CLASH_PENALTY", 0)
+    model = main.encode_problem(data)
+    schedule = main.decode_genome(main.generate_random_genome(model, np.random.default_rng(seed)), model)
+    assert main.fitness(schedule, data) == legacy_fitness(schedule, data)
+
+
+def test_fitness_matches_pairwise_version_off_table(data, monkeypatch):
+    # Entries whose intervals are not in timetable_slots get an ad-hoc slot table
+    monkeypatch.setattr(main, "STUDENT_CLASH_PENALTY", 0)
+    rng = random.Random(7)
+    schedule = [
+        {
+            "course_id": rng.choice(data['courses'])['id'],
+            "professor_id": rng.choice(data['professors'])['id'],
+            "classroom_id": rng.choice(data['classrooms'])['id'],
+            "day": rng.choice(benchmark.DAYS),
+            "start_time": f"{start // 60:02d}:{start % 60:02d}:00",
+            "end_time": f"{(start + length) // 60:02d}:{(start + length) % 60:02d}:00",
+        }
+        for start, length in ((rng.randrange(480, 960, 15), rng.choice((45, 60, 90))) for _ in range(80))
+    ]
+    assert main.fitness(schedule, data) == legacy_fitness(schedule, data)
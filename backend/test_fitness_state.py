@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import benchmark
+import main
+
+
+@pytest.fixture(scope="module")
+def data():
+    dataset = benchmark.synthetic_institution(courses=30, professors=5, classrooms=4, students=150, seed=3)
+    data = {}
+    for name in main.REFERENCE_TABLES:
+        data.update(main.reference_part(name, dataset[name]))
+    return data
+
+
+@pytest.fixture(scope="module")
+def model(data):
+    return main.encode_problem(data)
+
+
+def assert_matches_full_score(state, model, data):
+    genome = state.genome
+    assert state.total == main.genome_fitness(genome, model)
+    assert state.total == main.fitness(main.decode_genome(genome, model), data)
+
+
+def random_move(model, rng):
+    return (
+        int(rng.integers(len(model['gene_course']))),
+        int(rng.integers(len(model['slots']))),
+        int(rng.integers(len(model['professor_ids']))),
+        int(rng.integers(len(model['classroom_ids']))),
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_moves_match_full_score(data, model, seed):
+    rng = np.random.default_rng(seed)
+    state = main.FitnessState(model, main.generate_random_genome(model, rng))
+    assert_matches_full_score(state, model, data)
+    for _ in range(300):
+        move = random_move(model, rng)
+        before = state.total
+        predicted = state.delta(*move)
+        assert state.move(*move) == predicted
+        assert state.total == before + predicted
+    assert_matches_full_score(state, model, data)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_crossover_matches_full_score(data, model, seed):
+    rng = np.random.default_rng(seed)
+    first, second = (main.FitnessState(model, main.generate_random_genome(model, rng)) for _ in range(2))
+    # Moves on both sides of the split leave the per-half counters to be recombined
+    for state in (first, second):
+        for _ in range(50):
+            state.move(*random_move(model, rng))
+    child = main.FitnessState.crossover(first, second)
+    assert_matches_full_score(child, model, data)
+    for _ in range(50):
+        child.move(*random_move(model, rng))
+    assert_matches_full_score(child, model, data)
+    # The parents' counters must not be shared with the child
+    assert_matches_full_score(first, model, data)
+    assert_matches_full_score(second, model, data)
+
+
+@pytest.mark.parametrize("initializer", ["random", "constructive"])
+def test_breed_states_matches_full_score(data, model, initializer):
+    rng = np.random.default_rng(11)
+    states = [
+        main.FitnessState(model, genome) for genome in main.initial_population(model, 12, rng, initializer)
+    ]
+    for _ in range(10):
+        states = main.breed_states(states, np.array([state.total for state in states]), model, rng)
+    for state in states:
+        assert_matches_full_score(state, model, data)
@@ -0,0 +1,114 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import benchmark
+import main
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = benchmark.MemorySupabase()
+    monkeypatch.setattr(main, "supabase", db)
+    # Short chains, so snapshots in the middle of the sequence are exercised too
+    monkeypatch.setattr(main, "SNAPSHOT_INTERVAL", 4)
+    main.version_rows.clear()
+    return db
+
+
+@pytest.fixture(scope="module")
+def data():
+    dataset = benchmark.synthetic_institution(courses=20, professors=5, classrooms=4, students=80, seed=5)
+    data = {}
+    for name in main.REFERENCE_TABLES:
+        data.update(main.reference_part(name, dataset[name]))
+    return data
+
+
+def placements(rows):
+    return Counter(main.row_key(row) for row in rows)
+
+
+def user_rows(schedule, data):
+    # Every user's rows as a multiset of placements, keyed like persist_schedule's entries
+    users = {}
+    for row in schedule:
+        users.setdefault(("professor", row["professor_id"]), []).append(row)
+    for student_id, courses in data["enrollment_index"]["student_courses"].items():
+        rows = [row for row in schedule if row["course_id"] in courses]
+        if rows:
+            users[("student", student_id)] = rows
+    return {user: placements(rows) for user, rows in users.items()}
+
+
+def mutate(schedule, data, rng, moves):
+    schedule = [dict(row) for row in schedule]
+    slots = data["timetable_slots"]
+    for i in rng.choice(len(schedule), size=moves, replace=False):
+        slot = slots[int(rng.integers(len(slots)))]
+        schedule[i].update(
+            day=slot["day"], start_time=slot["start_time"], end_time=slot["end_time"],
+            classroom_id=data["classrooms"][int(rng.integers(len(data["classrooms"])))]["id"],
+        )
+    return schedule
+
+
+def schedules(data):
+    # A run of versions: small deltas, an unchanged rerun, a dropped course,
+    # a duplicated placement and a rewrite big enough to force a snapshot
+    rng = np.random.default_rng(0)
+    model = main.encode_problem(data)
+    schedule = main.decode_genome(main.generate_random_genome(model, rng), model)
+    yield schedule
+    for moves in (1, 3, 0, 2):
+        schedule = mutate(schedule, data, rng, moves)
+        yield schedule
+    dropped = schedule[0]["course_id"]
+    schedule = [row for row in schedule if row["course_id"] != dropped]
+    yield schedule
+    schedule = schedule + [dict(schedule[0])]
+    yield schedule
+    schedule = mutate(schedule, data, rng, len(schedule) * 2 // 3)
+    yield schedule
+    for moves in (2, 1, 4, 1, 1):
+        schedule = mutate(schedule, data, rng, moves)
+        yield schedule
+
+
+def test_versions_rebuild_and_notify_changed_users(db, data):
+    versions = []
+    previous_users = {}
+    for schedule in schedules(data):
+        notified_before = len(db.tables.get("notifications", []))
+        version_id = main.persist_schedule(schedule, "job", "Term", data)
+        versions.append((version_id, schedule))
+
+        users = user_rows(schedule, data)
+        changed = {
+            user for user in set(users) | set(previous_users)
+            if users.get(user, Counter()) != previous_users.get(user, Counter())
+        }
+        notified = [row["user_id"] for row in db.tables["notifications"][notified_before:]]
+        assert sorted(notified) == sorted({user_id for _, user_id in changed})
+        previous_users = users
+
+        # The newest entry along the chain lists each user's current courses
+        version = next(v for v in db.tables["timetable_versions"] if v["id"] == version_id)
+        chain = main.version_chain(version)
+        newest = {}
+        for entry in sorted(db.tables["timetable_entries"], key=lambda e: e["timetable_version_id"]):
+            if entry["timetable_version_id"] in chain:
+                newest[(entry["role"], entry["user_id"])] = entry["course_ids"]
+        assert {user: courses for user, courses in newest.items() if courses} == {
+            user: sorted({key[0] for key in rows}) for user, rows in users.items()
+        }
+
+    chains = [main.version_chain(v) for v in db.tables["timetable_versions"]]
+    assert any(len(chain) > 1 for chain in chains)
+    assert sum(len(chain) == 1 for chain in chains) > 2
+
+    # Rebuilt from schedule_rows alone, not from the rows cached at persist time
+    main.version_rows.clear()
+    for version_id, schedule in versions:
+        assert placements(main.load_schedule_rows(version_id)) == placements(schedule)
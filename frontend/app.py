@@ -71,14 +71,52 @@ def show_admin_page():
 
     # Generate timetable
     if st.button("Generate Timetable"):
-        response = requests.post(f"{BACKEND_API_URL}/generate-timetable", json={"term": "Fall 2025"})
+        response = requests.post(f"{BACKEND_API_URL}/generate-timetable", params={"term": "Fall 2025"})
         if response.ok:
             data = response.json()
-            st.success("Timetable generated")
-            st.json(data)
+            if data.get("status") == "cached":
+                st.success("Timetable already generated")
+                st.json(data)
+            else:
+                st.session_state.generation_job_id = data["job_id"]
         else:
             st.error(f"Generation failed: {response.text}")
 
+    job_id = st.session_state.get("generation_job_id")
+    if job_id:
+        show_generation_job(job_id)
+
+
+def show_generation_job(job_id):
+    response = requests.get(f"{BACKEND_API_URL}/job/{job_id}")
+    if not response.ok:
+        st.error(f"Failed to fetch job status: {response.text}")
+        return
+    job = response.json()
+
+    if job["status"] in ("queued", "running"):
+        st.info(f"Job {job_id}: {job['status']} ({job.get('phase') or 'waiting'})")
+        if job.get("generations"):
+            st.progress(min(job.get("generation", 0) / job["generations"], 1.0))
+        st.write(f"Best fitness so far: {job.get('best_fitness')}, elapsed: {job.get('elapsed_seconds', 0)}s")
+        if job.get("hard_conflicts") is not None:
+            st.write(f"Hard conflicts: {job['hard_conflicts']}, soft penalty: {job.get('soft_penalty')}")
+        col1, col2, col3 = st.columns(3)
+        if col1.button("Refresh status"):
+            st.rerun()
+        if col2.button("Stop and keep best"):
+            requests.post(f"{BACKEND_API_URL}/job/{job_id}/stop")
+            st.rerun()
+        if col3.button("Cancel generation"):
+            requests.post(f"{BACKEND_API_URL}/job/{job_id}/cancel")
+            st.rerun()
+    elif job["status"] == "completed":
+        st.success(f"Timetable generated (version {job.get('timetable_version_id')})")
+        st.session_state.pop("generation_job_id", None)
+    else:
+        st.error(f"Generation {job['status']}: {job.get('error', '')}")
+        st.session_state.pop("generation_job_id", None)
+
 def render_timetable_schedule(timetable):
     if not timetable:
         st.info("No classes found.")
@@ -110,17 +148,28 @@ def render_timetable_schedule(timetable):
 def show_timetable(db_user_id, role):
     st.header(f"{role.capitalize()} Timetable")
     params = {"user_id": db_user_id, "role": role}
-    response = requests.get(f"{BACKEND_API_URL}/user-timetable", params=params)
-
-    if response.ok:
+    # Revalidate with the last ETag so reruns don't refetch an unchanged timetable
+    cached = st.session_state.get("timetable_cache")
+    headers = {}
+    if cached and cached["params"] == params:
+        headers["If-None-Match"] = cached["etag"]
+    response = requests.get(f"{BACKEND_API_URL}/user-timetable", params=params, headers=headers)
+
+    if response.status_code == 304:
+        data = cached["data"]
+    elif response.ok:
         data = response.json()
-        timetable = data.get("timetable", [])
-        if not timetable:
-            st.info(data.get("message", "No timetable found."))
-            return
-        render_timetable_schedule(timetable)
+        if response.headers.get("ETag"):
+            st.session_state.timetable_cache = {"params": params, "etag": response.headers["ETag"], "data": data}
     else:
         st.error(f"Failed to fetch timetable: {response.text}")
+        return
+
+    timetable = data.get("timetable", [])
+    if not timetable:
+        st.info(data.get("message", "No timetable found."))
+        return
+    render_timetable_schedule(timetable)
 
 
 def main():